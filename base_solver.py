@@ -1,10 +1,12 @@
 import logging
 import random
+import resource
 from collections import Counter
-import datetime
+import time
 from metrics import Metrics
 import pickle
 from ml_utils import build_features
+from residual_formula import ResidualFormula
 
 class BaseSolver(object):
     def __init__(self, formula, atomic_props, log_level=None, log_file=None, branching_heuristic=None, model_path=None):
@@ -12,17 +14,29 @@ class BaseSolver(object):
         self.atomic_props = self.get_atomic_props(formula)
         self.set_log_level(log_level, log_file)
         self.pick_branching_num = 0
-        self.check_clause_status_time = 0.0
+        self.init_stats()
         self.load_model(model_path)
         self.branching_heuristic = branching_heuristic
         self.branching_fn = self.choose_branching_heuristic(branching_heuristic)
+        self.lookahead = None
+    def init_stats(self):
+        # Plain int counters, and phase timers adding up perf_counter_ns deltas taken when a
+        # phase starts and ends. decide_ns includes inference_ns, the ML model's share.
+        self.num_conflicts = 0
+        self.num_propagations = 0
+        self.num_learnt_total = 0
+        self.num_learnt_lits = 0
+        self.sum_backjump_distance = 0
+        self.max_backjump_distance = 0
+        self.propagate_ns = 0
+        self.analyze_ns = 0
+        self.decide_ns = 0
+        self.inference_ns = 0
     def get_atomic_props(self, formula):
         atomic_props = set()
         for clause in formula:
             [atomic_props.add(abs(lit)) for lit in clause]
         return list(atomic_props)
-    def hash_clause(self, clause):
-        return "#".join([str(lit) for lit in clause])
     def load_model(self, model_path):
         if model_path is None:
             self.model = None
@@ -31,18 +45,24 @@ class BaseSolver(object):
     def get_assign_value(self, next_var):
         if self.model is None:
             return 1
-        involved_clauses = self.get_involved_clauses(next_var) + self.get_involved_clauses(-next_var)
-        features = build_features(involved_clauses, next_var)
+        start_ns = time.perf_counter_ns()
+        features = build_features(self.get_feature_formula(next_var), next_var)
         predicted_val = self.model.predict(features)
+        self.inference_ns += time.perf_counter_ns() - start_ns
         logging.debug("Assigning {} to {}".format(next_var, predicted_val))
         return predicted_val
+    def get_decision_value(self, next_var):
+        forced_value = self.get_forced_value(next_var)
+        return forced_value if forced_value != -1 else self.get_assign_value(next_var)
+    def get_feature_formula(self, next_var):
+        return self.get_involved_clauses(next_var) + self.get_involved_clauses(-next_var)
     def assign_next_var(self, formula, assignments, shortened=False):
         self.pick_branching_num += 1
         if shortened:
             formula = self.shorten_formula(formula, assignments)
-        assert [] not in formula
+        assert formula.min_size() != 0 if isinstance(formula, ResidualFormula) else [] not in formula
         next_var = 0 if len(formula) == 0 else self.branching_fn(formula, assignments)[0]
-        next_var_val = -1 if next_var == 0 else self.get_assign_value(next_var)
+        next_var_val = -1 if next_var == 0 else self.get_decision_value(next_var)
         logging.debug("Assign {} next as {} at #{}".format(next_var, next_var_val, self.pick_branching_num))
         return next_var, next_var_val
     def compute_val(self, lit, assignments):
@@ -104,16 +124,20 @@ class BaseSolver(object):
                 var_counts[var] = 0 if var not in var_counts else var_counts[var]
                 var_counts[var] += 1
         return var_counts
-    def heuristic_moms(self, formula, assignments, k=1):
+    def get_min_clauses(self, formula):
+        # A residual formula keeps its open clauses bucketed by size
+        if isinstance(formula, ResidualFormula):
+            return formula.shortest_clauses()
         min_clause_size = min([len(clause) for clause in formula])
-        min_formula = [clause for clause in formula if len(clause) == min_clause_size]
+        return [clause for clause in formula if len(clause) == min_clause_size]
+    def heuristic_moms(self, formula, assignments, k=1):
+        min_formula = self.get_min_clauses(formula)
         return self.heuristic_maxo(min_formula, assignments, k)
     def heuristic_maxo(self, formula, assignments, k=1):
         var_counts = self.get_var_counts(formula)
         return [s[0] for s in var_counts.most_common(k)]
     def heuristic_mams(self, formula, assignments, k=1):
-        min_clause_size = min([len(clause) for clause in formula])
-        min_formula = [clause for clause in formula if len(clause) == min_clause_size]
+        min_formula = self.get_min_clauses(formula)
         moms_counts = self.get_var_counts(min_formula)
         maxo_counts = self.get_var_counts(formula)
         total_counts = Counter()
@@ -173,11 +197,22 @@ class BaseSolver(object):
         return num_unit_propagations, result_code
     def get_unit_lits(self, formula):
         return [clause[0] for clause in formula if len(clause) == 1]
+    def get_clause_list(self, formula):
+        # Lookahead resolves the formula once per tried literal, so a residual view is built once
+        return list(formula) if isinstance(formula, ResidualFormula) else formula
+    def get_model(self):
+        # {var: 0|1} of the assigned vars, a model of the formula after a SAT answer
+        return dict(self.assignments)
+    def get_forced_value(self, next_var):
+        return -1 if self.lookahead is None else self.lookahead.forced_value(next_var)
     def heuristic_up(self, formula, assignments, k=1):
         assigned_vars = assignments.keys()
         unassigned_vars = [var for var in self.atomic_props if var not in assigned_vars]
         return self._heuristic_up(formula, unassigned_vars, k)
     def _heuristic_up(self, formula, vars, k=1):
+        if self.lookahead is not None:
+            return self.lookahead.rank_vars(formula, vars, k)
+        formula = self.get_clause_list(formula)
         var_up_map = Counter()
         for var in vars:
             num_up_from_var, _ = self.get_num_unit_propagation(formula, var)
@@ -187,6 +222,9 @@ class BaseSolver(object):
     def heuristic_gup(self, formula, assignments, k=1):
         assigned_vars = assignments.keys()
         unassigned_vars = [var for var in self.atomic_props if var not in assigned_vars]
+        if self.lookahead is not None:
+            return self.lookahead.rank_vars(formula, unassigned_vars, k)
+        formula = self.get_clause_list(formula)
         var_up_map = Counter()
         for var in unassigned_vars:
             num_up_from_var, status_code = self.get_num_unit_propagation(formula, var)
@@ -198,6 +236,7 @@ class BaseSolver(object):
             var_up_map[var] = num_up_from_var + num_up_from_neg_var
         return [s[0] for s in var_up_map.most_common(k)]
     def heuristic_sup(self, formula, assignments, k=4):
+        formula = self.get_clause_list(formula)
         top_k_maxo = self.heuristic_maxo(formula, assignments, k)
         top_k_moms = self.heuristic_moms(formula, assignments, k)
         top_k_mams = self.heuristic_mams(formula, assignments, k)
@@ -216,9 +255,20 @@ class BaseSolver(object):
     def solve_sat(self):
         return random.choice([True, False])
     def solve(self):
-        start_time = datetime.datetime.now()
+        start_time = time.perf_counter()
         sat = self.solve_sat()
-        exec_time = (datetime.datetime.now() - start_time).total_seconds()
+        exec_time = time.perf_counter() - start_time
         pick_branching_num = self.pick_branching_num
-        check_clause_status_time = self.check_clause_status_time
-        return Metrics(sat, exec_time, pick_branching_num, check_clause_status_time)
\ No newline at end of file
+        metric = Metrics(sat, exec_time, pick_branching_num)
+        metric.num_conflicts = self.num_conflicts
+        metric.num_propagations = self.num_propagations
+        metric.num_learnt_total = self.num_learnt_total
+        metric.num_learnt_lits = self.num_learnt_lits
+        metric.sum_backjump_distance = self.sum_backjump_distance
+        metric.max_backjump_distance = self.max_backjump_distance
+        metric.propagate_time = self.propagate_ns * 1e-9
+        metric.analyze_time = self.analyze_ns * 1e-9
+        metric.decide_time = self.decide_ns * 1e-9
+        metric.inference_time = self.inference_ns * 1e-9
+        metric.peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return metric
\ No newline at end of file
@@ -0,0 +1,457 @@
+import argparse
+
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from io_utils import SatReader, open_input, CHUNK_SIZE, COMPRESSED_OPENERS
+from cdcl import CDCL, VSIDS_HEURISTICS
+from cdcl_wl import CDCL_WL
+from dpll import DPLL
+from einstein import gen_einstein
+
+CONFIGS = None
+
+BENCHMARK_SOLVERS = {
+    "cdcl": CDCL,
+    "cdcl_wl": CDCL_WL
+}
+
+# Suite instance sets, the examples are read from sat-examples/ and the others from --suite-dir
+SUITE_SOLVERS = {
+    "dpll": DPLL,
+    "cdcl": CDCL,
+    "cdcl_wl": CDCL_WL
+}
+SUITE_HEURISTICS = ("order", "random", "2clause", "maxo", "moms", "mams", "jw", "up", "gup", "sup") + VSIDS_HEURISTICS
+SUITE_EXAMPLES_DIR = "sat-examples"
+SUITE_SETS = ("examples", "random", "pigeonhole", "einstein")
+SUITE_RANDOM_SIZES = (50, 75, 100)
+SUITE_RANDOM_SEEDS = (0, 1)
+SUITE_PIGEONHOLE_SIZES = (4, 5, 6)
+
+def add_arguments(parser):
+    """Build ArgumentParser."""
+    parser.register("type", "bool", lambda v: v.lower() == "true")
+    parser.add_argument("--input", type=str, default=None, help="SAT input file or directory, random 3-SAT if not given")
+    parser.add_argument("--solver-name", type=str, default="cdcl,cdcl_wl", help="Comma separated solvers to benchmark")
+    parser.add_argument("--branching-heuristic", type=str, default="jw", help="Branching heuristic")
+    parser.add_argument("--num-vars", type=int, default=100, help="Number of variables of generated instances")
+    parser.add_argument("--ratio", type=float, default=4.26, help="Clause/variable ratio of generated instances")
+    parser.add_argument("--num-instances", type=int, default=5, help="Number of generated instances")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of generated instances")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs per instance")
+    parser.add_argument("--init-only", type="bool", default=False, help="Only measure solver initialisation")
+    parser.add_argument("--mode", type=str, default="solve",
+                        help="solve|trail|incremental|parse|suite|suite-generate, trail micro-benchmarks compute_val and backtrack, parse the DIMACS reader")
+    parser.add_argument("--num-queries", type=int, default=20, help="Assumption queries per instance in incremental mode")
+    parser.add_argument("--num-assumptions", type=int, default=5, help="Assumptions per query in incremental mode, vars per blocking clause with blocking queries")
+    parser.add_argument("--query-type", type=str, default="assumptions",
+                        help="assumptions|blocking, blocking adds a clause excluding the previous model before each query")
+    parser.add_argument("--suite-dir", type=str, default="benchmarks", help="Generated instance sets of the suite")
+    parser.add_argument("--suite-solvers", type=str, default="dpll,cdcl,cdcl_wl", help="Comma separated solvers run by the suite")
+    parser.add_argument("--suite-heuristics", type=str, default="all", help="Comma separated heuristics run by the suite, all for every one")
+    parser.add_argument("--suite-output", type=str, default="benchmarks/results.json", help="Medians of the suite's runs")
+    parser.add_argument("--baseline", type=str, default=None, help="Suite baseline to compare with, any regression fails the run")
+    parser.add_argument("--update-baseline", type="bool", default=False, help="Write the suite's results to --baseline instead of comparing with it")
+    parser.add_argument("--regression-threshold", type=float, default=0.2, help="Largest relative increase of median decisions/conflicts not counted as a regression")
+    parser.add_argument("--gate-time", type="bool", default=False,
+                        help="Also gate on times, off by default as they depend on the machine and its load: only meaningful on the baseline's machine")
+    parser.add_argument("--time-threshold", type=float, default=1.0, help="Largest relative increase of a solver and heuristic's total time not counted as a regression")
+    parser.add_argument("--min-time", type=float, default=5.0, help="Total times below this many seconds are compared as this value")
+    parser.add_argument("--min-count", type=int, default=100, help="Median decisions/conflicts below this value are compared as this value")
+    parser.add_argument("--compression", type=str, default="none,gz", help="Comma separated none|gz|bz2|xz files written per generated instance in parse mode")
+
+def generate_random_ksat(num_vars, ratio, seed, k=3):
+    rng = random.Random(seed)
+    formula = []
+    for _ in range(int(round(num_vars * ratio))):
+        clause_vars = rng.sample(range(1, num_vars+1), k)
+        formula.append([var if rng.random() < 0.5 else -var for var in clause_vars])
+    return formula
+
+def get_input_paths(input_path):
+    if os.path.isdir(input_path):
+        return [os.path.join(input_path, name) for name in sorted(os.listdir(input_path))]
+    return [input_path]
+
+def load_instances(configs):
+    if configs.input is None:
+        return [("random-{}-{}".format(configs.num_vars, configs.seed + i),
+                 generate_random_ksat(configs.num_vars, configs.ratio, configs.seed + i))
+                for i in range(configs.num_instances)]
+    sat_reader = SatReader()
+    return [(os.path.basename(path), sat_reader.read_input(path).formula) for path in get_input_paths(configs.input)]
+
+def write_dimacs(path, formula, num_vars):
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(path)[1], open)
+    with opener(path, "wb") as output_file:
+        output_file.write("p cnf {} {}\n".format(num_vars, len(formula)).encode())
+        output_file.write("".join([" ".join(map(str, clause)) + " 0\n" for clause in formula]).encode())
+
+def time_raw_read(path):
+    num_bytes = 0
+    start_time = time.perf_counter()
+    with open_input(path) as input_file:
+        chunk = input_file.read(CHUNK_SIZE)
+        while chunk:
+            num_bytes += len(chunk)
+            chunk = input_file.read(CHUNK_SIZE)
+    return time.perf_counter() - start_time, num_bytes
+
+def time_parse(path):
+    start_time = time.perf_counter()
+    cnf = SatReader().read_cnf(path)
+    return time.perf_counter() - start_time, len(cnf.offsets) - 1
+
+def run_parse_benchmark(configs):
+    # Compares parsing with just reading (and decompressing) the same file, best of --repeat runs
+    temp_dir = None
+    if configs.input is None:
+        temp_dir = tempfile.mkdtemp()
+        input_paths = []
+        for i in range(configs.num_instances):
+            formula = generate_random_ksat(configs.num_vars, configs.ratio, configs.seed + i)
+            for compression in configs.compression.split(","):
+                extension = ".cnf" if compression == "none" else ".cnf." + compression
+                path = os.path.join(temp_dir, "random-{}-{}{}".format(configs.num_vars, configs.seed + i, extension))
+                write_dimacs(path, formula, configs.num_vars)
+                input_paths.append(path)
+    else:
+        input_paths = get_input_paths(configs.input)
+    print("{:<28} {:>8} {:>10} {:>10} {:>10} {:>10} {:>11}".format("input", "MB", "clauses", "read (s)", "parse (s)", "MB/s", "parse/read"))
+    try:
+        for path in input_paths:
+            read_time, num_bytes = min([time_raw_read(path) for _ in range(configs.repeat)])
+            parse_time, num_clauses = min([time_parse(path) for _ in range(configs.repeat)])
+            num_mb = num_bytes / float(1 << 20)
+            print("{:<28} {:>8.2f} {:>10} {:>10.4f} {:>10.4f} {:>10.1f} {:>11.2f}".format(
+                os.path.basename(path), num_mb, num_clauses, read_time, parse_time, num_mb / parse_time, parse_time / read_time))
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+def benchmark_solver(solver_class, formula, branching_heuristic, init_only=False):
+    start_time = time.perf_counter()
+    solver = solver_class([list(clause) for clause in formula], [], branching_heuristic=branching_heuristic)
+    init_time = time.perf_counter() - start_time
+    if init_only:
+        return init_time, 0.0, 0.0, 0, None
+    start_time = time.perf_counter()
+    metric = solver.solve()
+    solve_time = time.perf_counter() - start_time
+    return init_time, solve_time, metric.propagate_time, metric.num_propagations, metric
+
+def descend(solver):
+    level = solver.trail.decision_level()
+    while True:
+        sat, _ = solver.force_assign_var(level+1)
+        if sat:
+            return level
+        level += 1
+        if solver.deduce(level):
+            return level
+
+def benchmark_trail(solver_class, formula, branching_heuristic, repeat):
+    solver = solver_class([list(clause) for clause in formula], [], branching_heuristic=branching_heuristic)
+    if not solver.assign_unit_clauses() or solver.deduce(0):
+        return 0.0, 0.0, 0
+    descend(solver)
+    all_lits = solver.atomic_props + [-var for var in solver.atomic_props]
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for lit in all_lits:
+            solver.compute_val(lit, solver.assignments)
+    compute_val_time = (time.perf_counter() - start_time) / (repeat * len(all_lits))
+    backtrack_time, num_undone = 0.0, 0
+    for _ in range(repeat):
+        solver.backtrack(0)
+        descend(solver)
+        num_undone += len(solver.assignments) - len(solver.trail.level_lits(0))
+        start_time = time.perf_counter()
+        solver.backtrack(0)
+        backtrack_time += time.perf_counter() - start_time
+    return compute_val_time, backtrack_time / repeat, num_undone / float(repeat)
+
+def run_trail_benchmark(configs):
+    instances = load_instances(configs)
+    print("{:<10} {:>18} {:>18} {:>12}".format("solver", "compute_val (ns)", "backtrack (us)", "undone"))
+    for solver_name in configs.solver_name.split(","):
+        solver_class = BENCHMARK_SOLVERS[solver_name]
+        results = [benchmark_trail(solver_class, formula, configs.branching_heuristic, max(configs.repeat, 100)) for _, formula in instances]
+        compute_val_time = sum([r[0] for r in results]) / len(results)
+        backtrack_time = sum([r[1] for r in results]) / len(results)
+        num_undone = sum([r[2] for r in results]) / len(results)
+        print("{:<10} {:>18.1f} {:>18.2f} {:>12.1f}".format(solver_name, compute_val_time * 1e9, backtrack_time * 1e6, num_undone))
+
+def generate_queries(formula, num_queries, num_assumptions, seed):
+    rng = random.Random(seed)
+    num_vars = max([abs(lit) for clause in formula for lit in clause])
+    return [[var if rng.random() < 0.5 else -var for var in rng.sample(range(1, num_vars+1), min(num_assumptions, num_vars))]
+            for _ in range(num_queries)]
+
+def blocking_clause(solver, num_vars):
+    return [-var if solver.trail.values[var] == 1 else var for var in range(1, num_vars+1)]
+
+def benchmark_queries(solver_class, formula, queries, branching_heuristic, incremental, num_blocking_vars=0):
+    # Solves every query with a fresh solver or with one solver reused across queries. With
+    # num_blocking_vars, queries have no assumptions and each model is excluded on its first
+    # num_blocking_vars vars for the following queries.
+    formula = [list(clause) for clause in formula]
+    blocking = num_blocking_vars > 0
+    solver = None
+    total_time, num_conflicts, num_unsat = 0.0, 0, 0
+    for assumptions in queries:
+        if blocking:
+            assumptions = []
+        start_time = time.perf_counter()
+        if solver is None or not incremental:
+            solver = solver_class([list(clause) for clause in formula], [], branching_heuristic=branching_heuristic)
+        conflicts_before = solver.num_conflicts
+        metric = solver.solve(assumptions)
+        total_time += time.perf_counter() - start_time
+        num_conflicts += solver.num_conflicts - conflicts_before
+        num_unsat += 0 if metric.sat else 1
+        if blocking:
+            if not metric.sat:
+                break
+            clause = blocking_clause(solver, num_blocking_vars)
+            formula.append(clause)
+            start_time = time.perf_counter()
+            if incremental:
+                solver.add_clause(clause)
+            total_time += time.perf_counter() - start_time
+    return total_time, num_conflicts, num_unsat
+
+def run_incremental_benchmark(configs):
+    instances = load_instances(configs)
+    print("{:<10} {:>12} {:>10} {:>14} {:>10} {:>10} {:>8}".format(
+        "solver", "fresh (s)", "conflicts", "incremental (s)", "conflicts", "speedup", "unsat"))
+    for solver_name in configs.solver_name.split(","):
+        solver_class = BENCHMARK_SOLVERS[solver_name]
+        fresh_time, fresh_conflicts, incremental_time, incremental_conflicts, num_unsat = 0.0, 0, 0.0, 0, 0
+        for i, (_, formula) in enumerate(instances):
+            queries = generate_queries(formula, configs.num_queries, configs.num_assumptions, configs.seed + i)
+            num_blocking_vars = len(queries[0]) if configs.query_type == "blocking" else 0
+            run_time, conflicts, _ = benchmark_queries(solver_class, formula, queries, configs.branching_heuristic, False, num_blocking_vars)
+            fresh_time += run_time
+            fresh_conflicts += conflicts
+            run_time, conflicts, unsat = benchmark_queries(solver_class, formula, queries, configs.branching_heuristic, True, num_blocking_vars)
+            incremental_time += run_time
+            incremental_conflicts += conflicts
+            num_unsat += unsat
+        speedup = fresh_time / incremental_time if incremental_time > 0 else 0.0
+        print("{:<10} {:>12.4f} {:>10} {:>14.4f} {:>10} {:>10.2f} {:>8}".format(
+            solver_name, fresh_time, fresh_conflicts, incremental_time, incremental_conflicts, speedup, num_unsat))
+
+def run_benchmark(configs):
+    instances = load_instances(configs)
+    print("{:<10} {:>10} {:>10} {:>12} {:>10} {:>12}".format("solver", "init (s)", "solve (s)", "deduce (s)", "props", "props/s"))
+    for solver_name in configs.solver_name.split(","):
+        solver_class = BENCHMARK_SOLVERS[solver_name]
+        total_init, total_solve, total_propagation, total_props = 0.0, 0.0, 0.0, 0
+        for _, formula in instances:
+            for _ in range(configs.repeat):
+                init_time, solve_time, propagation_time, num_propagations, _ = benchmark_solver(solver_class, formula, configs.branching_heuristic, configs.init_only)
+                total_init += init_time
+                total_solve += solve_time
+                total_propagation += propagation_time
+                total_props += num_propagations
+        props_per_sec = total_props / total_propagation if total_propagation > 0 else 0.0
+        print("{:<10} {:>10.4f} {:>10.4f} {:>12.4f} {:>10} {:>12.1f}".format(solver_name, total_init, total_solve, total_propagation, total_props, props_per_sec))
+
+def generate_pigeonhole(num_holes):
+    # num_holes + 1 pigeons in num_holes holes, var (i-1)*num_holes+j puts pigeon i in hole j
+    def var(pigeon, hole):
+        return (pigeon - 1) * num_holes + hole
+    formula = [[var(pigeon, hole) for hole in range(1, num_holes+1)] for pigeon in range(1, num_holes+2)]
+    for hole in range(1, num_holes+1):
+        for pigeon in range(1, num_holes+2):
+            for other in range(pigeon+1, num_holes+2):
+                formula.append([-var(pigeon, hole), -var(other, hole)])
+    return formula
+
+def generate_suite(configs):
+    # Writes the random, pigeonhole and einstein sets, meant to be generated once and checked in
+    instance_sets = {
+        "random": [("random-{}-{}.cnf".format(num_vars, seed), generate_random_ksat(num_vars, 4.26, seed), num_vars)
+                   for num_vars in SUITE_RANDOM_SIZES for seed in SUITE_RANDOM_SEEDS],
+        "pigeonhole": [("php-{}.cnf".format(num_holes), generate_pigeonhole(num_holes), (num_holes + 1) * num_holes)
+                       for num_holes in SUITE_PIGEONHOLE_SIZES],
+        "einstein": [("einstein.cnf", gen_einstein(), 125)]
+    }
+    for set_name, instances in sorted(instance_sets.items()):
+        set_dir = os.path.join(configs.suite_dir, set_name)
+        os.makedirs(set_dir, exist_ok=True)
+        for name, formula, num_vars in instances:
+            write_dimacs(os.path.join(set_dir, name), formula, num_vars)
+            print("Wrote {}".format(os.path.join(set_dir, name)))
+
+def load_suite_instances(configs):
+    # [(set name, instance name, formula)]
+    sat_reader = SatReader(cache_dir="")
+    instances = []
+    for set_name in SUITE_SETS:
+        set_dir = SUITE_EXAMPLES_DIR if set_name == "examples" else os.path.join(configs.suite_dir, set_name)
+        if not os.path.isdir(set_dir):
+            raise Exception("Missing suite instance set {}, run --mode suite-generate".format(set_dir))
+        for path in get_input_paths(set_dir):
+            instances.append((set_name, os.path.basename(path), sat_reader.read_input(path).formula))
+    return instances
+
+def run_suite_instance(solver_class, formula, branching_heuristic, seed):
+    # Seeds random for the random heuristic and tie breaks, so repetitions make the same search
+    # and only differ in time
+    random.seed(seed)
+    start_time = time.perf_counter()
+    solver = solver_class([list(clause) for clause in formula], [], branching_heuristic=branching_heuristic)
+    metric = solver.solve()
+    return time.perf_counter() - start_time, metric
+
+def run_suite(configs):
+    instances = load_suite_instances(configs)
+    heuristics = SUITE_HEURISTICS if configs.suite_heuristics == "all" else configs.suite_heuristics.split(",")
+    results = []
+    print("{:<8} {:<8} {:<11} {:<16} {:>6} {:>10} {:>10} {:>10}".format(
+        "solver", "heur", "set", "instance", "sat", "time (s)", "decisions", "conflicts"))
+    for solver_name in configs.suite_solvers.split(","):
+        solver_class = SUITE_SOLVERS[solver_name]
+        for branching_heuristic in heuristics:
+            if branching_heuristic in VSIDS_HEURISTICS and solver_class is DPLL:
+                continue
+            for set_name, name, formula in instances:
+                runs = [run_suite_instance(solver_class, formula, branching_heuristic, configs.seed) for _ in range(max(configs.repeat, 1))]
+                result = {
+                    "solver": solver_name,
+                    "heuristic": branching_heuristic,
+                    "set": set_name,
+                    "instance": name,
+                    "sat": runs[0][1].sat,
+                    "time": statistics.median([run_time for run_time, _ in runs]),
+                    "min_time": min([run_time for run_time, _ in runs]),
+                    "decisions": statistics.median([metric.pick_branching_num for _, metric in runs]),
+                    "conflicts": statistics.median([metric.num_conflicts for _, metric in runs])
+                }
+                results.append(result)
+                print("{:<8} {:<8} {:<11} {:<16} {:>6} {:>10.4f} {:>10} {:>10}".format(
+                    solver_name, branching_heuristic, set_name, name, "SAT" if result["sat"] else "UNSAT",
+                    result["time"], result["decisions"], result["conflicts"]))
+    suite_results = {
+        "machine": platform.platform(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "repeat": max(configs.repeat, 1),
+        "seed": configs.seed,
+        "results": results
+    }
+    output_dir = os.path.dirname(configs.suite_output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(configs.suite_output, "w") as f:
+        json.dump(suite_results, f, indent=1, sort_keys=True)
+    failures = check_suite_answers(results)
+    if configs.baseline and configs.update_baseline:
+        write_baseline(configs.baseline, results, configs)
+    elif configs.baseline:
+        with open(configs.baseline) as f:
+            baseline = json.load(f)
+        failures += compare_to_baseline(results, baseline["results"], configs)
+    for failure in failures:
+        print(failure)
+    print("{} results written to {}, {} failures".format(len(results), configs.suite_output, len(failures)))
+    return len(failures) == 0
+
+def check_suite_answers(results):
+    # Every solver and heuristic must find the same answer for an instance
+    answers = {}
+    for result in results:
+        answers.setdefault((result["set"], result["instance"]), set()).add(result["sat"])
+    return ["WRONG {}/{}: solvers disagree on SAT/UNSAT".format(set_name, name)
+            for (set_name, name), sat_answers in sorted(answers.items()) if len(sat_answers) > 1]
+
+def get_result_name(result):
+    return "/".join((result["solver"], result["heuristic"], result["set"], result["instance"]))
+
+def write_baseline(path, results, configs):
+    # Only the fields the gate reads: answers, counts and the fastest and median times, along
+    # with the machine the times were measured on
+    fields = ("sat", "decisions", "conflicts", "min_time", "time")
+    baseline = {
+        "machine": platform.platform(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "repeat": max(configs.repeat, 1),
+        "seed": configs.seed,
+        "results": dict((get_result_name(result), dict((field, result[field]) for field in fields)) for result in results)
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+    print("{} results written to the baseline {}".format(len(results), path))
+
+def compare_to_baseline(results, baseline, configs):
+    # baseline is {result name: fields written by write_baseline}. Decisions and conflicts are
+    # deterministic and regress when they exceed the baseline's, floored at --min-count, by more
+    # than --regression-threshold. With --gate-time, the total of the fastest times of each solver
+    # and heuristic regresses when it exceeds the baseline's, floored at --min-time, by more than
+    # --time-threshold. Results missing from the baseline, and baseline results of the solvers
+    # and heuristics run that the run did not produce, are failures too.
+    failures = []
+    num_compared = 0
+    # {(solver, heuristic): [total time, total baseline time]}
+    total_times = {}
+    names = set(get_result_name(result) for result in results)
+    configs_run = set((result["solver"], result["heuristic"]) for result in results)
+    for name in sorted(baseline):
+        if name not in names and tuple(name.split("/")[:2]) in configs_run:
+            failures.append("MISSING {}: in the baseline but not run".format(name))
+    for result in results:
+        name = get_result_name(result)
+        if name not in baseline:
+            failures.append("MISSING {}: not in the baseline, update it with --update-baseline true".format(name))
+            continue
+        num_compared += 1
+        baseline_result = baseline[name]
+        if result["sat"] != baseline_result["sat"]:
+            failures.append("WRONG {}: {} instead of {}".format(
+                name, "SAT" if result["sat"] else "UNSAT", "SAT" if baseline_result["sat"] else "UNSAT"))
+        for field in ("decisions", "conflicts"):
+            limit = max(baseline_result[field], configs.min_count) * (1 + configs.regression_threshold)
+            if result[field] > limit:
+                failures.append("REGRESSION {}: {} {} > {} (baseline {})".format(
+                    name, field, result[field], round(limit, 1), baseline_result[field]))
+        if configs.gate_time:
+            if "min_time" not in baseline_result:
+                raise Exception("Baseline has no times for {}, update it with --gate-time true".format(name))
+            times = total_times.setdefault((result["solver"], result["heuristic"]), [0.0, 0.0])
+            times[0] += result["min_time"]
+            times[1] += baseline_result["min_time"]
+    for (solver_name, branching_heuristic), (total_time, baseline_time) in sorted(total_times.items()):
+        limit = max(baseline_time, configs.min_time) * (1 + configs.time_threshold)
+        if total_time > limit:
+            failures.append("REGRESSION {}/{}: total time {:.3f}s > {:.3f}s (baseline {:.3f}s)".format(
+                solver_name, branching_heuristic, total_time, limit, baseline_time))
+    print("{} results compared with the baseline".format(num_compared))
+    return failures
+
+if __name__ == "__main__":
+    benchmark_parser = argparse.ArgumentParser()
+    add_arguments(benchmark_parser)
+    CONFIGS, unparsed = benchmark_parser.parse_known_args()
+    if CONFIGS.mode == "trail":
+        run_trail_benchmark(CONFIGS)
+    elif CONFIGS.mode == "incremental":
+        run_incremental_benchmark(CONFIGS)
+    elif CONFIGS.mode == "parse":
+        run_parse_benchmark(CONFIGS)
+    elif CONFIGS.mode == "suite-generate":
+        generate_suite(CONFIGS)
+    elif CONFIGS.mode == "suite":
+        if not run_suite(CONFIGS):
+            sys.exit(1)
+    else:
+        run_benchmark(CONFIGS)
@@ -0,0 +1,125 @@
+from residual_formula import ResidualFormula
+from var_heap import VarHeap
+
+INCREMENTAL_HEURISTICS = ("jw", "maxo", "moms", "mams", "2clause")
+
+class BranchingScores(ResidualFormula):
+    """Scores of the jw/maxo/moms/mams/2clause heuristics kept up to date on a ResidualFormula.
+
+    For every open clause, each of its vars counts one occurrence in occ, 2^-u in jw and one
+    occurrence in size_occ[u], u being the number of unassigned literals of the clause. For
+    an unassigned var these are exactly the counts the heuristics compute on the shortened
+    formula, and they only change when a clause opens, closes or shrinks.
+    """
+    def __init__(self, heuristic, num_vars, clauses=()):
+        self.heuristic = heuristic
+        self.track_occ = heuristic in ("maxo", "mams")
+        self.track_jw = heuristic == "jw"
+        self.track_sizes = heuristic in ("moms", "mams", "2clause")
+        self.occ = [0.0]
+        self.jw = [0.0]
+        self.size_occ = {}
+        self.heap = None
+        super(BranchingScores, self).__init__(num_vars)
+        if self.track_jw or self.track_occ:
+            self.heap = VarHeap(self.jw if self.track_jw else self.occ)
+            self.heap.grow(num_vars)
+        for clause in clauses:
+            self.add_clause(clause)
+        if self.heap is not None:
+            self.heap.build(range(1, self.num_vars + 1))
+    def grow(self, num_vars):
+        if num_vars <= self.num_vars:
+            return
+        new_vars = range(self.num_vars + 1, num_vars + 1)
+        self.occ.extend([0.0] * len(new_vars))
+        self.jw.extend([0.0] * len(new_vars))
+        super(BranchingScores, self).grow(num_vars)
+        if self.heap is not None:
+            self.heap.grow(num_vars)
+            for var in new_vars:
+                self.heap.insert(var)
+    def open_clause(self, clause_id, sign):
+        # sign 1 adds the clause's contribution to the scores, -1 removes it
+        super(BranchingScores, self).open_clause(clause_id, sign)
+        size = self.num_unassigned[clause_id]
+        clause = self.clauses[clause_id]
+        # Every key change is followed by its heap update, batching them would break the heap
+        if self.track_occ:
+            occ = self.occ
+            update = self.heap.increase if sign > 0 else self.heap.decrease
+            for lit in clause:
+                occ[abs(lit)] += sign
+                update(abs(lit))
+        if self.track_jw:
+            jw = self.jw
+            weight = sign * 2.0 ** -size
+            update = self.heap.increase if sign > 0 else self.heap.decrease
+            for lit in clause:
+                jw[abs(lit)] += weight
+                update(abs(lit))
+        if self.track_sizes:
+            bucket = self.size_occ.setdefault(size, {})
+            for lit in clause:
+                var = abs(lit)
+                count = bucket.get(var, 0) + sign
+                if count == 0:
+                    del bucket[var]
+                else:
+                    bucket[var] = count
+    def resize_clause(self, clause_id, size):
+        old_size = self.num_unassigned[clause_id]
+        clause = self.clauses[clause_id]
+        if self.track_jw:
+            jw = self.jw
+            delta = 2.0 ** -size - 2.0 ** -old_size
+            update = self.heap.increase if delta > 0 else self.heap.decrease
+            for lit in clause:
+                jw[abs(lit)] += delta
+                update(abs(lit))
+        if self.track_sizes:
+            old_bucket = self.size_occ[old_size]
+            bucket = self.size_occ.setdefault(size, {})
+            for lit in clause:
+                var = abs(lit)
+                count = old_bucket[var] - 1
+                if count == 0:
+                    del old_bucket[var]
+                else:
+                    old_bucket[var] = count
+                bucket[var] = bucket.get(var, 0) + 1
+        super(BranchingScores, self).resize_clause(clause_id, size)
+    def unassign(self, lit):
+        super(BranchingScores, self).unassign(lit)
+        if self.heap is not None:
+            self.heap.insert(abs(lit))
+    def best_in_bucket(self, size, base_scores=None):
+        best_var, best_score = 0, -1
+        values = self.values
+        for var, count in self.size_occ.get(size, {}).items():
+            if values[var] != -1:
+                continue
+            score = count + base_scores[var] if base_scores is not None else count
+            if score > best_score:
+                best_var, best_score = var, score
+        return best_var, best_score
+    def heap_top(self):
+        heap, values = self.heap, self.values
+        while len(heap) > 0 and values[heap.heap[0]] != -1:
+            heap.pop_max()
+        return heap.heap[0] if len(heap) > 0 else 0
+    def pick_branching_var(self):
+        # Returns 0 when every clause is satisfied, None when 2clause finds no binary clause
+        if len(self.open_clause_ids) == 0:
+            return 0
+        if self.heuristic in ("jw", "maxo"):
+            return self.heap_top()
+        min_size = self.min_size()
+        if self.heuristic == "moms":
+            return self.best_in_bucket(min_size)[0]
+        if self.heuristic == "mams":
+            var, score = self.best_in_bucket(min_size, self.occ)
+            top_var = self.heap_top()
+            return top_var if top_var != 0 and self.occ[top_var] > score else var
+        var, _ = self.best_in_bucket(2)
+        return var if var != 0 else None
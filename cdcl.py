@@ -1,4 +1,3 @@
-import datetime
 import math
 import time
 import random
@@ -6,37 +5,88 @@ import pprint
 from collections import deque, Counter
 import logging
 import operator
-from itertools import chain
 from base_solver import BaseSolver
+from clause_db import ClauseDB, LEARNT, IMPORTED
+from trail import Trail, AssignmentView, NO_REASON
+from var_heap import VarHeap
+from restart import choose_restart_policy
+from branching_scores import BranchingScores, INCREMENTAL_HEURISTICS
+from residual_formula import ResidualFormula
+from lookahead import Lookahead, LOOKAHEAD_HEURISTICS
+from preprocessor import equivalent_lit_components
+
+VSIDS_HEURISTICS = ("cvsids", "mvsids")
+REPHASE_MODES = (None, "none", "target", "best")
 
 class CDCL(BaseSolver):
-    def __init__(self, formula, atomic_props, log_level=None, log_file=None, branching_heuristic=None, model_path=None):
+    def __init__(self, formula, atomic_props, log_level=None, log_file=None, branching_heuristic=None, model_path=None,
+                 restart_policy=None, restart_interval=100, reuse_trail=False, reduce_interval=2000,
+                 phase_saving=True, rephase=None, lookahead_budget=20, clause_sharing=None, inprocessing=False,
+                 inprocess_interval=1000, inprocess_budget=0.1, inprocess_probe_budget=0.05):
         super(CDCL, self).__init__(formula, atomic_props, log_level, log_file, branching_heuristic, model_path)
-        self.assignments, self.level_assignments = {}, {}
-        self.implication_graph, self.level_forced_assign_var_map = {}, {}
+        self.num_vars = max(self.atomic_props) if self.atomic_props else 0
+        self.trail = Trail(self.num_vars)
+        self.assignments = AssignmentView(self.trail)
+        self.conflict_clause_id = NO_REASON
+        self.seen = [False] * (self.num_vars + 1)
+        self.num_minimized_lits = 0
         self.init_var_clause_map(atomic_props)
-        self.newly_assigned_vars = []
-        self.num_conflicts = 0
+        self.restart_policy = choose_restart_policy(restart_policy, restart_interval)
+        self.reuse_trail = reuse_trail
+        self.init_clause_reduction(reduce_interval)
+        self.init_phases(phase_saving, rephase)
+        self.init_inprocessing(inprocessing, inprocess_interval, inprocess_budget, inprocess_probe_budget)
+        self.assumptions = []
+        self.failed_assumptions = []
+        self.clause_sharing = clause_sharing
         self.branching_fn = self.choose_branching_heuristic(branching_heuristic)
+        self.init_residual_formula()
+        if branching_heuristic in LOOKAHEAD_HEURISTICS:
+            self.lookahead = Lookahead(self, lookahead_budget)
     def choose_branching_heuristic(self, branching_heuristic):
-        if branching_heuristic == "mvsids" or branching_heuristic == "cvsids":
+        self.var_heap = None
+        if branching_heuristic in VSIDS_HEURISTICS:
             self.init_vsids()
             return self.heuristic_vsids
         return super(CDCL, self).choose_branching_heuristic(branching_heuristic)
+    def init_residual_formula(self):
+        # VSIDS only needs the residual formula for the ML model's features
+        self.residual_formula = None
+        self.branching_scores = None
+        if self.branching_heuristic in INCREMENTAL_HEURISTICS:
+            self.branching_scores = BranchingScores(self.branching_heuristic, self.num_vars, self.clause_db)
+            self.residual_formula = self.branching_scores
+        elif self.branching_heuristic not in VSIDS_HEURISTICS or self.model is not None:
+            self.residual_formula = ResidualFormula(self.num_vars, self.clause_db)
     def init_vsids(self):
-        self.var_activities = {}
+        # EVSIDS: instead of decaying every activity after each conflict, the bump
+        # (bonus_score) grows by 1/decay_val and everything is rescaled on overflow.
         self.var_decided_vals = {}
-        self.decay_val = 0.8
-        self.decay_period = 1
-        self.bonus_coeff = 1.2
-        self.var_activities = dict(self.compute_jw_scores(self.formula))
-        self.bonus_score = max(list(self.var_activities.values()))/2.0
+        self.decay_val = 0.95
+        self.rescale_limit = 1e100
+        num_vars = max(self.atomic_props) if self.atomic_props else 0
+        self.var_activities = [0.0] * (num_vars + 1)
+        for var, jw_score in self.compute_jw_scores(self.formula).items():
+            self.var_activities[var] = jw_score
+        self.bonus_score = max(self.var_activities) / 2.0 if num_vars > 0 else 1.0
+        self.var_heap = VarHeap(self.var_activities, self.atomic_props)
     def heuristic_vsids(self, formula, assignments, k=1):
-        remaining_var_activities = {}
-        for var, activity in self.var_activities.items():
-            if var not in self.assignments:
-                remaining_var_activities[var] = activity
-        return [x[0] for x in sorted(remaining_var_activities.items(), key=lambda x: x[1])][:-k]
+        next_vars = []
+        values = self.trail.values
+        while len(next_vars) < k and len(self.var_heap) > 0:
+            var = self.var_heap.pop_max()
+            if values[var] == -1:
+                next_vars.append(var)
+        for var in next_vars[1:]:
+            self.var_heap.insert(var)
+        return next_vars if next_vars else [0]
+    def bump_var_activity(self, var):
+        self.var_activities[var] += self.bonus_score
+        if self.var_activities[var] > self.rescale_limit:
+            for v in range(len(self.var_activities)):
+                self.var_activities[v] /= self.rescale_limit
+            self.bonus_score /= self.rescale_limit
+        self.var_heap.increase(var)
     def get_assign_value_vsids(self, next_var):
         if next_var not in self.var_decided_vals:
             next_var_val = self.get_assign_value(next_var)
@@ -44,19 +94,63 @@ class CDCL(BaseSolver):
         else:
             next_var_val = self.var_decided_vals[next_var]
         return next_var_val
+    def init_phases(self, phase_saving, rephase):
+        # Phases are 1/0 per var, -1 when unknown. saved_phases keeps the last value of every
+        # unassigned var. target_phases/best_phases record the longest conflict-free trail since
+        # the last restart/ever, and replace the saved phases at restarts when rephasing.
+        if rephase not in REPHASE_MODES:
+            raise ValueError("Unrecognised rephase mode")
+        self.phase_saving = phase_saving
+        self.rephase = None if rephase == "none" else rephase
+        self.saved_phases = [-1] * (self.num_vars + 1)
+        self.target_phases = [-1] * (self.num_vars + 1)
+        self.best_phases = [-1] * (self.num_vars + 1)
+        self.target_size = 0
+        self.best_size = 0
+    def update_target_phases(self, size):
+        lits = self.trail.lits
+        if size > self.target_size:
+            self.target_size = size
+            for i in range(size):
+                self.target_phases[abs(lits[i])] = 1 if lits[i] > 0 else 0
+        if size > self.best_size:
+            self.best_size = size
+            for i in range(size):
+                self.best_phases[abs(lits[i])] = 1 if lits[i] > 0 else 0
+    def rephase_saved_phases(self):
+        phases = self.target_phases if self.rephase == "target" else self.best_phases
+        saved_phases = self.saved_phases
+        for var in range(1, self.num_vars + 1):
+            if phases[var] != -1:
+                saved_phases[var] = phases[var]
+        self.target_size = 0
+    def get_decision_value(self, var):
+        forced_value = self.get_forced_value(var)
+        if forced_value != -1:
+            return forced_value
+        if self.phase_saving and self.saved_phases[var] != -1:
+            return self.saved_phases[var]
+        if self.branching_heuristic in VSIDS_HEURISTICS:
+            return self.get_assign_value_vsids(var)
+        return self.get_assign_value(var)
+    def get_feature_formula(self, next_var):
+        if self.residual_formula is None:
+            return super(CDCL, self).get_feature_formula(next_var)
+        return self.residual_formula.sync(self.trail.lits)
     def assign_next_var(self, formula, assignments, shortened=False):
         self.pick_branching_num += 1
-        if shortened:
-            formula = self.shorten_formula(formula, assignments)
-        assert [] not in formula
-        next_var = 0 if len(formula) == 0 else self.branching_fn(formula, assignments)[0]
-        if next_var != 0:
-            if self.branching_heuristic == "cvsids" or self.branching_heuristic == "mvsids":
-                next_var_val = self.get_assign_value_vsids(next_var)
-            else:
-                next_var_val = self.get_assign_value(next_var)
+        if self.branching_heuristic in VSIDS_HEURISTICS:
+            # With complete propagation, no unassigned var left means every clause is satisfied
+            next_var = self.heuristic_vsids(formula, assignments)[0]
+        elif self.branching_scores is not None:
+            self.branching_scores.sync(self.trail.lits)
+            next_var = self.branching_scores.pick_branching_var()
+            if next_var is None:
+                next_var = self.heuristic_random(formula, assignments)[0]
         else:
-            next_var_val = -1
+            formula = self.residual_formula.sync(self.trail.lits)
+            next_var = 0 if len(formula) == 0 else self.branching_fn(formula, assignments)[0]
+        next_var_val = -1 if next_var == 0 else self.get_decision_value(next_var)
         logging.debug("Assign {} next as {} at #{}".format(next_var, next_var_val, self.pick_branching_num))
         return next_var, next_var_val
     def set_log_level(self, log_level, log_file):
@@ -69,76 +163,68 @@ class CDCL(BaseSolver):
             else:
                 logging.basicConfig(level=logging.DEBUG)
     def init_var_clause_map(self, atomic_props):
-        self.hash_clause_map = {}
-        self.lit_hash_map = {}
-        self.clause_idx_hash_map = {}
-        for i, clause in enumerate(self.formula):
-            clause_hash = self.hash_clause(clause)
-            self.hash_clause_map[clause_hash] = clause
-            self.clause_idx_hash_map[i] = clause_hash
+        self.clause_db = ClauseDB(self.formula)
+        self.build_lit_clause_map()
+    def build_lit_clause_map(self):
+        self.lit_clause_map = {}
         for var in self.atomic_props:
-            self.lit_hash_map[var] = []
-            self.lit_hash_map[-var] = []
-        for clause in self.formula:
-            for lit in clause:
-                self.lit_hash_map[lit].append(self.hash_clause(clause))
+            self.lit_clause_map[var] = []
+            self.lit_clause_map[-var] = []
+        lits = self.clause_db.lits
+        for clause_id in self.clause_db.clause_ids():
+            for i in self.clause_db.clause_range(clause_id):
+                self.lit_clause_map[lits[i]].append(clause_id)
     def compute_ap_assignment_value(self, lit):
         return 1 if lit > 0 else 0
-    def assign_var(self, var, level, value):
-        if var in self.assignments:
-            if self.assignments[var][0] != value: 
-                return False
-            return True
-        self.assignments[var] = (value, level)
-        if level not in self.level_assignments:
-            self.level_assignments[level] = []
-        self.level_assignments[level].append(var)
+    def compute_val(self, lit, assignments):
+        return self.trail.values[lit]
+    def assign_lit(self, lit, reason=NO_REASON):
+        lit_val = self.trail.values[lit]
+        if lit_val != -1:
+            return lit_val == 1
+        self.trail.assign(lit, reason)
         return True
-    def _force_assign_var(self, var, level, value):
-        self.assign_var(var, level, value)
-        self.level_forced_assign_var_map[level] = var
     def force_assign_var(self, level):
         logging.debug("Level {}".format(level))
-        next_var, next_var_val = self.assign_next_var(self.formula, self.assignments, True)
+        next_var, next_var_val = self.assign_next_var(self.clause_db, self.assignments, True)
         if next_var == 0:
             return True, next_var
-        if level not in self.level_assignments:
-            self.level_assignments[level] = []
-        self._force_assign_var(next_var, level, next_var_val)
+        self.trail.new_level()
+        self.assign_lit(next_var if next_var_val == 1 else -next_var)
         return False, next_var
     def assign_pure_vars(self, level):
-        if level-1 not in self.level_assignments:
-            checking_vars = self.atomic_props
-        else:
-            last_assigned_vars = self.level_assignments[level-1]
-            checking_vars = set()
-            for var in last_assigned_vars:
-                true_lit = var if self.assignments[var][0] > 0 else -var
-                for clause in self.get_involved_clauses(true_lit):
-                    checking_vars.union(set([abs(lit) for lit in clause]))
-            checking_vars = list(checking_vars)
-        for var in checking_vars:
+        # Pure vars are searched whenever the previous level has no assignments, i.e. at
+        # level 0 and right above an empty level 0. They are only sound once all assumptions
+        # are on the trail, and are undone with the rest of the trail by the next solve call.
+        if level > 0 and self.trail.level_size(level-1) > 0:
+            return
+        if self.trail.decision_level() < len(self.assumptions):
+            return
+        # Only implied lits may be on level 0 when clauses learnt on top of it are shared
+        if level == 0 and self.clause_sharing is not None:
+            return
+        for var in self.atomic_props:
             if var not in self.assignments:
                 has_pos_lit = False
-                for clause_hash in self.lit_hash_map[var]:
-                    if self.check_clause_status_wrapper(clause_hash)[0] != "sat":
+                for clause_id in self.lit_clause_map[var]:
+                    if self.check_clause_status(clause_id)[0] != "sat":
                         has_pos_lit = True
+                        break
                 if not has_pos_lit:
-                    assignable = self.assign_var(var, level, 0)
+                    assignable = self.assign_lit(-var)
                     if not assignable:
                         raise Exception("Pure var must be assignable")
-                    self.update_newly_assigned_vars([var], False)
                     logging.debug("Assigning value 0 to {} from pure vars".format(var))
                     continue
                 has_neg_lit = False
-                for clause_hash in self.lit_hash_map[-var]:
-                    if self.check_clause_status_wrapper(clause_hash)[0] != "sat":
+                for clause_id in self.lit_clause_map[-var]:
+                    if self.check_clause_status(clause_id)[0] != "sat":
                         has_neg_lit = True
+                        break
                 if not has_neg_lit:
-                    assignable = self.assign_var(var, level, 1)
+                    assignable = self.assign_lit(var)
                     if not assignable:
                         raise Exception("Pure var must be assignable")
-                    self.update_newly_assigned_vars([var], False)
                     logging.debug("Assigning value 1 to {} from pure vars".format(var))
     def assign_conflict_lit(self, clause, level):
         conflict_lit = 0
@@ -150,152 +236,646 @@ class CDCL(BaseSolver):
             raise Exception("Conflict clause must have a lit assigned in conflict level.")
         logging.debug("Assign {} as conflict lit".format(conflict_lit))
         return conflict_lit
-    def update_implication_graph(self, unassigned_lit, parents):
-        if unassigned_lit in self.implication_graph:
-            raise Exception("Unassigned lit {} already exists in implication graph.".format(unassigned_lit))
-        self.implication_graph[unassigned_lit] = parents
-    def update_newly_assigned_vars(self, vars, force):
-        if force:
-            self.newly_assigned_vars = vars
-        else:
-            for v in vars:
-                if v not in self.newly_assigned_vars:
-                    self.newly_assigned_vars = [v] + self.newly_assigned_vars
-        logging.debug("Newly assigned vars {}".format(self.newly_assigned_vars))
     def get_involved_clauses(self, lit):
-        return [self.hash_clause_map[h] for h in self.lit_hash_map[lit]]
-    def check_clause_status_wrapper(self, clause_hash):
-        start_time = datetime.datetime.now()
-        res = self.check_clause_status(clause_hash)
-        exec_time = (datetime.datetime.now() - start_time).total_seconds()
-        self.check_clause_status_time += exec_time
-        return res
-    def check_clause_status(self, clause_hash):
-        clause = self.hash_clause_map[clause_hash]
-        clause_values = [self.compute_val(lit, self.assignments) for lit in clause]
-        if 1 not in clause_values:  
-            if -1 not in clause_values:
-                logging.debug("Conflict detected in clause {}".format(clause))
-                return "conflict", clause, 0
-            if sum(clause_values) == -1:
-                unassigned_lit = clause[clause_values.index(-1)]
-                return "unit", clause, unassigned_lit
-            return "unassaigned", [], 0
-        return "sat", [], 0
+        return [self.clause_db.get_clause(clause_id) for clause_id in self.lit_clause_map[lit]]
+    def check_clause_status(self, clause_id):
+        lits = self.clause_db.lits
+        unassigned_lit, num_unassigned = 0, 0
+        for i in self.clause_db.clause_range(clause_id):
+            lit_val = self.compute_val(lits[i], self.assignments)
+            if lit_val == 1:
+                return "sat", [], 0
+            if lit_val == -1:
+                unassigned_lit = lits[i]
+                num_unassigned += 1
+        if num_unassigned == 0:
+            clause = self.clause_db.get_clause(clause_id)
+            logging.debug("Conflict detected in clause {}".format(clause))
+            return "conflict", clause, 0
+        if num_unassigned == 1:
+            return "unit", self.clause_db.get_clause(clause_id), unassigned_lit
+        return "unassaigned", [], 0
     def deduce(self, level):
-        while len(self.newly_assigned_vars) > 0:
-            var = self.newly_assigned_vars.pop()
-            true_lit = var if self.assignments[var][0] > 0 else -var
-            false_lit = -true_lit
-            logging.debug("Formula of newly assigned vars {}".format(self.get_involved_clauses(var)))
-            for clause_hash in self.lit_hash_map[false_lit]:
-                status, clause, unassigned_lit = self.check_clause_status_wrapper(clause_hash)
+        trail = self.trail
+        while trail.propagated < len(trail.lits):
+            true_lit = trail.lits[trail.propagated]
+            trail.propagated += 1
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug("Formula of newly assigned vars {}".format(self.get_involved_clauses(abs(true_lit))))
+            for clause_id in self.lit_clause_map[-true_lit]:
+                status, clause, unassigned_lit = self.check_clause_status(clause_id)
                 if status == "conflict":
-                    self.update_implication_graph(0, clause)
+                    self.conflict_clause_id = clause_id
                     return True
                 if status == "unit":
-                    self.assign_lit_from_clause(unassigned_lit, clause, level)
-                    self.update_implication_graph(unassigned_lit, [-lit for lit in clause if lit != unassigned_lit])
-                    self.update_newly_assigned_vars([abs(unassigned_lit)], False)
+                    self.num_propagations += 1
+                    self.assign_lit_from_clause(unassigned_lit, clause_id)
         return False
-    def assign_lit_from_clause(self, unassigned_lit, clause, level):
-        assigned_value = 1 if unassigned_lit > 0 else 0
-        var = abs(unassigned_lit)
-        logging.debug("Assigning value {} to {} from {}".format(assigned_value, var, clause))
-        self.assign_var(var, level, assigned_value)
-    def get_learnt_clause(self, analysing_clause):
-        return [-lit for lit in analysing_clause]
+    def get_model(self):
+        return {abs(lit): 1 if lit > 0 else 0 for lit in self.trail.lits}
+    def get_trail_lits(self):
+        return self.trail.lits
+    def probe_lit(self, lit):
+        # Lookahead: propagates lit on a new decision level, then undoes it. Not counted
+        # as search propagations.
+        level = self.trail.decision_level()
+        trail_size = len(self.trail)
+        num_propagations = self.num_propagations
+        self.trail.new_level()
+        self.trail.assign(lit)
+        conflict = self.deduce(level + 1)
+        num_implied = len(self.trail) - trail_size - 1
+        self.trail.cancel_until(level)
+        self.num_propagations = num_propagations
+        self.conflict_clause_id = NO_REASON
+        return num_implied, conflict
+    def assign_lit_from_clause(self, unassigned_lit, clause_id):
+        logging.debug("Assigning {} from clause {}".format(unassigned_lit, clause_id))
+        self.trail.assign(unassigned_lit, clause_id)
     def conflict_analyse(self, level):
-        temp_level_lits_map = {}
-        analysing_clause = [-lit for lit in self.implication_graph[0]]
-        for lit in analysing_clause:
-            lvl = self.assignments[abs(lit)][1]
-            if lvl not in temp_level_lits_map:
-                temp_level_lits_map[lvl] = []
-            temp_level_lits_map[lvl].append(lit)
-        while len(temp_level_lits_map[level]) > 1:
-            logging.debug("Analysing {}".format(list(chain.from_iterable(temp_level_lits_map.values()))))
-            next_lit = temp_level_lits_map[level][1] if abs(temp_level_lits_map[level][0]) == self.level_forced_assign_var_map[level] else temp_level_lits_map[level][0]
-            for parent in self.implication_graph[next_lit]:
-                parent_lvl = self.assignments[abs(parent)][1]
-                if parent_lvl not in temp_level_lits_map:
-                    temp_level_lits_map[parent_lvl] = []
-                if -parent in temp_level_lits_map[parent_lvl]:
-                    raise Exception("Learnt clause must not have 2 opposite lits")
-                if parent not in temp_level_lits_map[parent_lvl]:
-                    temp_level_lits_map[parent_lvl].append(parent)
-            temp_level_lits_map[level].remove(next_lit)
+        # First-UIP: resolve the conflict clause with reasons of current-level literals in
+        # reverse trail order until a single current-level literal is left.
+        trail_lits, levels, reasons = self.trail.lits, self.trail.levels, self.trail.reasons
+        lits, seen = self.clause_db.lits, self.seen
+        learnt_clause = [0]
+        num_current_level_lits = 0
+        clause_id = self.conflict_clause_id
+        resolved_lit = 0
+        index = len(trail_lits) - 1
+        while True:
+            if self.clause_db.learnt[clause_id]:
+                self.bump_clause_activity(clause_id)
+                if self.clause_db.learnt[clause_id] == IMPORTED:
+                    self.clause_db.learnt[clause_id] = LEARNT
+                    self.clause_sharing.num_useful += 1
+            for i in self.clause_db.clause_range(clause_id):
+                lit = lits[i]
+                var = abs(lit)
+                if lit == resolved_lit or seen[var] or levels[var] == 0:
+                    continue
+                seen[var] = True
+                if levels[var] >= level:
+                    num_current_level_lits += 1
+                else:
+                    learnt_clause.append(lit)
+            while not seen[abs(trail_lits[index])]:
+                index -= 1
+            resolved_lit = trail_lits[index]
+            index -= 1
+            seen[abs(resolved_lit)] = False
+            num_current_level_lits -= 1
+            if num_current_level_lits == 0:
+                break
             if self.branching_heuristic == "mvsids":
-                self.var_activities[abs(next_lit)] += self.bonus_score
-        learnt_clause = self.get_learnt_clause(list(chain.from_iterable(temp_level_lits_map.values())))
-        levels = [self.assignments[abs(lit)][1] for lit in learnt_clause]
-        backtrack_level = 0 if len(levels) < 2 else sorted(levels)[-2]
-        logging.debug("Learning new clause {}, levels {}".format(learnt_clause, levels))
+                self.bump_var_activity(abs(resolved_lit))
+            clause_id = reasons[abs(resolved_lit)]
+        learnt_clause[0] = -resolved_lit
+        num_lits = len(learnt_clause)
+        self.minimize_learnt_clause(learnt_clause)
+        self.num_minimized_lits += num_lits - len(learnt_clause)
+        backtrack_level = 0
+        if len(learnt_clause) > 1:
+            max_idx = 1
+            for i in range(2, len(learnt_clause)):
+                if levels[abs(learnt_clause[i])] > levels[abs(learnt_clause[max_idx])]:
+                    max_idx = i
+            learnt_clause[1], learnt_clause[max_idx] = learnt_clause[max_idx], learnt_clause[1]
+            backtrack_level = levels[abs(learnt_clause[1])]
+        lbd = len(set([levels[abs(lit)] for lit in learnt_clause]))
+        logging.debug("Learning new clause {}, lbd {}".format(learnt_clause, lbd))
         logging.debug("Backtrack to level {}".format(backtrack_level))
-        return learnt_clause, backtrack_level
-    def backtrack(self, backtrack_level, current_level):
-        forced_assign_var = self.level_forced_assign_var_map[backtrack_level] if backtrack_level != 0  else -1
-        forced_assign_var_value = self.assignments[forced_assign_var][0] if backtrack_level != 0 else -1
-        for level in range(backtrack_level, current_level+1):
-            if level != 0:
-                logging.debug("Clearing level {}".format(level))
-                assigned_aps = self.level_assignments[level]
-                for var in assigned_aps:
-                    del self.assignments[var]
-                    if var in self.implication_graph:
-                        del self.implication_graph[var]
-                    if -var in self.implication_graph:
-                        del self.implication_graph[-var]
-                del self.level_assignments[level]
-                del self.level_forced_assign_var_map[level]
-        del self.implication_graph[0]
-        return forced_assign_var, forced_assign_var_value
-    def update_learnt_clause(self, learnt_clause):
-        clause_hash = self.hash_clause(learnt_clause)
-        self.hash_clause_map[clause_hash] = learnt_clause
-        self.clause_idx_hash_map[len(self.clause_idx_hash_map)] = clause_hash
-        self.formula.append(learnt_clause)
+        return learnt_clause, backtrack_level, lbd
+    def minimize_learnt_clause(self, learnt_clause):
+        # Recursive minimisation: drop literals implied by the other literals of the clause.
+        # seen is still set for learnt_clause[1:] when called, and fully cleared on return.
+        levels, reasons, seen = self.trail.levels, self.trail.reasons, self.seen
+        abstract_levels = 0
+        for lit in learnt_clause[1:]:
+            abstract_levels |= 1 << (levels[abs(lit)] & 31)
+        marked_lits = learnt_clause[1:]
+        j = 1
+        for i in range(1, len(learnt_clause)):
+            lit = learnt_clause[i]
+            if reasons[abs(lit)] == NO_REASON or not self.is_redundant_lit(lit, abstract_levels, marked_lits):
+                learnt_clause[j] = lit
+                j += 1
+        del learnt_clause[j:]
+        for lit in marked_lits:
+            seen[abs(lit)] = False
+    def is_redundant_lit(self, lit, abstract_levels, marked_lits):
+        levels, reasons, seen = self.trail.levels, self.trail.reasons, self.seen
+        lits = self.clause_db.lits
+        stack = [lit]
+        num_marked = len(marked_lits)
+        while stack:
+            implied_var = abs(stack.pop())
+            for i in self.clause_db.clause_range(reasons[implied_var]):
+                parent = lits[i]
+                var = abs(parent)
+                if var == implied_var or seen[var] or levels[var] == 0:
+                    continue
+                if reasons[var] != NO_REASON and (1 << (levels[var] & 31)) & abstract_levels:
+                    seen[var] = True
+                    stack.append(parent)
+                    marked_lits.append(parent)
+                else:
+                    for marked_lit in marked_lits[num_marked:]:
+                        seen[abs(marked_lit)] = False
+                    del marked_lits[num_marked:]
+                    return False
+        return True
+    def backtrack(self, backtrack_level):
+        logging.debug("Backtracking from level {} to {}".format(self.trail.decision_level(), backtrack_level))
+        undone_lits = self.trail.cancel_until(backtrack_level)
+        if self.residual_formula is not None:
+            self.residual_formula.cancel(len(self.trail))
+        if self.phase_saving:
+            saved_phases = self.saved_phases
+            for lit in undone_lits:
+                saved_phases[abs(lit)] = 1 if lit > 0 else 0
+        if self.var_heap is not None:
+            for lit in undone_lits:
+                self.var_heap.insert(abs(lit))
+    def update_learnt_clause(self, learnt_clause, lbd=0, imported=False):
+        clause_id = self.clause_db.add_clause(learnt_clause, learnt=True, lbd=lbd, imported=imported)
         for lit in learnt_clause:
-            self.lit_hash_map[lit].append(clause_hash)
-        return clause_hash
+            self.lit_clause_map[lit].append(clause_id)
+        if self.residual_formula is not None:
+            self.residual_formula.add_clause(learnt_clause)
+        return clause_id
+    def import_shared_clauses(self):
+        # Adds the other workers' new clauses at level 0, unassigned lits first, and assigns
+        # the ones that are unit. Returns False if one is false, i.e. the formula is UNSAT.
+        values = self.trail.values
+        for clause, lbd in self.clause_sharing.import_clauses():
+            if any(values[lit] == 1 for lit in clause):
+                continue
+            clause.sort(key=lambda lit: values[lit] == 0)
+            clause_id = self.update_learnt_clause(clause, lbd, imported=True)
+            if values[clause[0]] == 0:
+                logging.debug("Imported clause {} is false at level 0".format(clause))
+                return False
+            if len(clause) == 1 or values[clause[1]] == 0:
+                self.assign_lit(clause[0], clause_id)
+        return True
     def update_var_activities(self, learnt_clause):
         if self.branching_heuristic == "cvsids":
             for lit in learnt_clause:
-                self.var_activities[abs(lit)] += self.bonus_score
-        logging.debug("Activity score: {}".format(self.var_activities))
-        self.bonus_score *= math.ceil(self.bonus_coeff)
-        if self.num_conflicts % self.decay_period == 0:
-            for var in self.var_activities:
-                self.var_activities[var] *= self.decay_val
-            self.bonus_score *= math.ceil(self.decay_val)
+                self.bump_var_activity(abs(lit))
+        self.bonus_score /= self.decay_val
+    def assign_unit_clauses(self):
+        for clause_id in self.clause_db.clause_ids():
+            clause_size = self.clause_db.clause_size(clause_id)
+            if clause_size == 0:
+                return False
+            if clause_size == 1:
+                if not self.assign_lit(self.clause_db.lits[self.clause_db.offsets[clause_id]], clause_id):
+                    return False
+        return True
+    def init_clause_reduction(self, reduce_interval):
+        # Learnt clauses with lbd <= core_lbd are kept forever, half of the others are
+        # deleted every reduce_interval conflicts, the interval growing by reduce_factor.
+        self.reduce_interval = reduce_interval
+        self.next_reduce = reduce_interval
+        self.reduce_factor = 1.1
+        self.core_lbd = 2
+        self.clause_bonus = 1.0
+        self.clause_decay = 0.999
+        self.num_reductions = 0
+        self.num_deleted_clauses = 0
+        self.max_learnt_clauses = 0
+        self.peak_clause_db_bytes = 0
+    def bump_clause_activity(self, clause_id):
+        activities = self.clause_db.activities
+        activities[clause_id] += self.clause_bonus
+        if activities[clause_id] > 1e20:
+            for i in range(len(activities)):
+                activities[i] *= 1e-20
+            self.clause_bonus *= 1e-20
+    def locked_clause_ids(self):
+        reasons = self.trail.reasons
+        return set(reasons[abs(lit)] for lit in self.trail.lits)
+    def reduce_learnt_clauses(self):
+        clause_db = self.clause_db
+        lbds, activities = clause_db.lbds, clause_db.activities
+        locked_ids = self.locked_clause_ids()
+        candidates = [clause_id for clause_id in clause_db.clause_ids()
+                      if clause_db.learnt[clause_id] and lbds[clause_id] > self.core_lbd and clause_id not in locked_ids]
+        candidates.sort(key=lambda clause_id: (lbds[clause_id], -activities[clause_id]))
+        deleted_ids = set(candidates[len(candidates)//2:])
+        logging.debug("Reducing learnt clauses: {} learnt, {} deleted".format(clause_db.num_learnt, len(deleted_ids)))
+        self.peak_clause_db_bytes = max(self.peak_clause_db_bytes, clause_db.memory_bytes())
+        self.remap_clause_ids(clause_db.delete_clauses(deleted_ids))
+        self.num_reductions += 1
+        self.num_deleted_clauses += len(deleted_ids)
+        self.reduce_interval *= self.reduce_factor
+        self.next_reduce = self.num_conflicts + int(self.reduce_interval)
+    def remap_clause_ids(self, remap):
+        reasons = self.trail.reasons
+        for lit in self.trail.lits:
+            var = abs(lit)
+            if reasons[var] != NO_REASON:
+                reasons[var] = remap[reasons[var]]
+        self.conflict_clause_id = NO_REASON
+        self.build_lit_clause_map()
+        self.init_residual_formula()
+    def init_inprocessing(self, inprocessing, inprocess_interval, inprocess_budget, inprocess_probe_budget):
+        # At level 0, every inprocess_interval conflicts and as long as it took less than
+        # inprocess_budget of the solve call's time, the formula is simplified by the lits
+        # fixed at level 0 and learnt clauses are vivified. Failed lit probing and equivalent
+        # lit substitution on the binary clauses then get their own inprocess_probe_budget.
+        self.inprocessing = inprocessing
+        self.inprocess_interval = inprocess_interval
+        self.next_inprocess = inprocess_interval
+        self.inprocess_budget = inprocess_budget
+        self.inprocess_probe_budget = inprocess_probe_budget
+        self.search_start_time = time.perf_counter()
+        self.inprocess_time = 0.0
+        self.probe_time = 0.0
+        self.num_inprocessings = 0
+        self.num_root_satisfied_clauses = 0
+        self.num_root_false_lits = 0
+        self.num_vivified_clauses = 0
+        self.num_vivified_lits = 0
+        self.num_failed_lits = 0
+        self.num_equivalent_vars = 0
+        self.substituted_vars = set()
+    def is_root_implied(self, lit):
+        # Pure lits are also set at level 0 but only hold for the current solve call, clauses
+        # are never simplified with them
+        var = abs(lit)
+        return self.trail.values[lit] != -1 and self.trail.levels[var] == 0 and self.trail.reasons[var] != NO_REASON
+    def inprocess(self):
+        # Level 0 only. Returns False if the formula turned out UNSAT.
+        start_time = time.perf_counter()
+        self.next_inprocess = self.num_conflicts + self.inprocess_interval
+        search_time = start_time - self.search_start_time
+        allowed_time = self.inprocess_budget * search_time - self.inprocess_time
+        allowed_probe_time = self.inprocess_probe_budget * search_time - self.probe_time
+        if allowed_time <= 0 and allowed_probe_time <= 0:
+            return True
+        self.num_inprocessings += 1
+        conflict_free = True
+        if allowed_time > 0:
+            conflict_free = self.simplify_and_vivify(start_time + allowed_time)
+            self.inprocess_time += time.perf_counter() - start_time
+        if conflict_free and allowed_probe_time > 0:
+            probe_start_time = time.perf_counter()
+            conflict_free = self.probe_and_substitute(probe_start_time + allowed_probe_time)
+            self.probe_time += time.perf_counter() - probe_start_time
+        return conflict_free
+    def simplify_and_vivify(self, deadline):
+        # Vivification propagates through the watches, so clauses are only rewritten after it
+        shortened_clauses = self.vivify_learnt_clauses(deadline)
+        for clause_id, clause in shortened_clauses.items():
+            self.clause_db.shrink_clause(clause_id, clause)
+        deleted_ids = self.simplify_root_clauses()
+        remap = self.clause_db.delete_clauses(deleted_ids)
+        self.remap_clause_ids(remap)
+        logging.debug("Inprocessing: {} clauses deleted, {} clauses vivified".format(len(deleted_ids), len(shortened_clauses)))
+        for clause_id, clause in shortened_clauses.items():
+            if len(clause) == 1 and not self.assign_lit(clause[0], remap[clause_id]):
+                return False
+        return True
+    def root_implication_graph(self):
+        # Binary clause (a, b) with both lits unassigned gives the edges -a -> b and -b -> a
+        clause_db = self.clause_db
+        values = self.trail.values
+        graph = {}
+        for clause_id in clause_db.clause_ids():
+            if clause_db.sizes[clause_id] != 2:
+                continue
+            first_lit, second_lit = clause_db.get_clause(clause_id)
+            if values[first_lit] != -1 or values[second_lit] != -1:
+                continue
+            graph.setdefault(-first_lit, []).append(second_lit)
+            graph.setdefault(-second_lit, []).append(first_lit)
+        return graph
+    def probe_and_substitute(self, deadline):
+        # Probes the lits implying others through binary clauses, a failed lit's negation is
+        # learnt as a unit, then substitutes equivalent lits. Returns False if the formula
+        # turned out UNSAT.
+        if self.deduce(0):
+            return False
+        values = self.trail.values
+        for lit in self.root_implication_graph():
+            if time.perf_counter() > deadline:
+                return True
+            if values[lit] != -1 or not self.probe_lit(lit)[1]:
+                continue
+            logging.debug("Inprocessing: failed lit {}".format(lit))
+            self.num_failed_lits += 1
+            clause_id = self.update_learnt_clause([-lit], lbd=1)
+            self.assign_lit(-lit, clause_id)
+            if self.deduce(0):
+                return False
+        return self.substitute_equivalent_lits()
+    def substitute_equivalent_lits(self):
+        # Each strongly connected component of the binary implication graph is replaced by its
+        # lit of smallest var in every clause but the binary clauses defining the equivalences,
+        # so propagation still assigns the substituted vars and the model needs no extension.
+        # Returns False if a lit is equivalent to its negation.
+        substitutes = {}
+        for component in equivalent_lit_components(self.root_implication_graph()):
+            if any(-lit in component for lit in component):
+                return False
+            representative = min(component, key=abs)
+            # Every component has a mirror one with the negated lits, only one of them is used
+            if representative < 0:
+                continue
+            for lit in component:
+                if lit != representative:
+                    substitutes[lit] = representative
+                    substitutes[-lit] = -representative
+        if not substitutes:
+            return True
+        clause_db = self.clause_db
+        # Rewritten clauses are watched from scratch, so the lits of level 0 are stripped first
+        deleted_ids = self.simplify_root_clauses()
+        locked_ids = self.locked_clause_ids()
+        definitions = set()
+        unit_clauses = []
+        for clause_id in clause_db.clause_ids():
+            if clause_id in deleted_ids or clause_id in locked_ids or clause_db.sizes[clause_id] == 1:
+                continue
+            clause = clause_db.get_clause(clause_id)
+            if not any(lit in substitutes for lit in clause):
+                continue
+            if len(clause) == 2 and (substitutes.get(clause[0]) == -clause[1] or substitutes.get(clause[1]) == -clause[0]):
+                definitions.add(frozenset(clause))
+                continue
+            substituted_clause = list(dict.fromkeys(substitutes.get(lit, lit) for lit in clause))
+            if any(-lit in substituted_clause for lit in substituted_clause):
+                deleted_ids.add(clause_id)
+                continue
+            clause_db.shrink_clause(clause_id, substituted_clause)
+            if len(substituted_clause) == 1:
+                unit_clauses.append(clause_id)
+        for lit, representative in substitutes.items():
+            if lit < 0:
+                continue
+            for definition in ([-lit, representative], [lit, -representative]):
+                if frozenset(definition) not in definitions:
+                    clause_db.add_clause(definition)
+            if lit not in self.substituted_vars:
+                self.substituted_vars.add(lit)
+                self.num_equivalent_vars += 1
+        remap = clause_db.delete_clauses(deleted_ids)
+        self.remap_clause_ids(remap)
+        logging.debug("Inprocessing: {} equivalent lits substituted".format(len(substitutes) // 2))
+        for clause_id in unit_clauses:
+            clause_id = remap[clause_id]
+            if not self.assign_lit(clause_db.lits[clause_db.offsets[clause_id]], clause_id):
+                return False
+        return True
+    def simplify_root_clauses(self):
+        # Strips the lits false at level 0 and returns the ids of the clauses true at level 0.
+        # Unit clauses are kept, as they are the reasons of the lits of level 0.
+        clause_db = self.clause_db
+        values = self.trail.values
+        deleted_ids = set()
+        for clause_id in clause_db.clause_ids():
+            if clause_db.sizes[clause_id] == 1:
+                continue
+            clause = clause_db.get_clause(clause_id)
+            root_lits = [lit for lit in clause if self.is_root_implied(lit)]
+            if not root_lits:
+                continue
+            kept_lits = [lit for lit in clause if lit not in root_lits or values[lit] == 1]
+            if len(kept_lits) > 1 and any(values[lit] == 1 for lit in root_lits):
+                deleted_ids.add(clause_id)
+                self.num_root_satisfied_clauses += 1
+            elif len(kept_lits) < len(clause):
+                clause_db.shrink_clause(clause_id, kept_lits)
+                self.num_root_false_lits += len(clause) - len(kept_lits)
+        return deleted_ids
+    def vivify_learnt_clauses(self, deadline):
+        # Assigns the negations of a learnt clause's lits one by one: a lit already false
+        # is dropped, and a lit already true or a conflict ends the clause. Returns the
+        # shortened clauses by id.
+        clause_db = self.clause_db
+        values = self.trail.values
+        locked_ids = self.locked_clause_ids()
+        candidates = [clause_id for clause_id in clause_db.clause_ids()
+                      if clause_db.learnt[clause_id] and clause_db.sizes[clause_id] > 2 and clause_id not in locked_ids]
+        candidates.sort(key=lambda clause_id: (clause_db.lbds[clause_id], -clause_db.activities[clause_id]))
+        num_propagations = self.num_propagations
+        shortened_clauses = {}
+        for clause_id in candidates:
+            if time.perf_counter() > deadline:
+                break
+            clause = clause_db.get_clause(clause_id)
+            kept_lits = []
+            for lit in clause:
+                lit_val = values[lit]
+                if lit_val != -1 and self.trail.levels[abs(lit)] == 0 and not self.is_root_implied(lit):
+                    kept_lits.append(lit)
+                    continue
+                if lit_val == 0:
+                    continue
+                kept_lits.append(lit)
+                if lit_val == 1:
+                    break
+                self.trail.new_level()
+                self.trail.assign(-lit)
+                if self.deduce(self.trail.decision_level()):
+                    break
+            self.trail.cancel_until(0)
+            if len(kept_lits) < len(clause):
+                shortened_clauses[clause_id] = kept_lits
+                self.num_vivified_clauses += 1
+                self.num_vivified_lits += len(clause) - len(kept_lits)
+        self.num_propagations = num_propagations
+        self.conflict_clause_id = NO_REASON
+        return shortened_clauses
+    def get_restart_level(self):
+        # Partial restart: keep the decision levels whose decision var is still more active
+        # than the var VSIDS would decide next, since they would be decided again anyway.
+        if not self.reuse_trail or self.var_heap is None:
+            return 0
+        next_var = self.heuristic_vsids(None, self.assignments)[0]
+        if next_var == 0:
+            return 0
+        self.var_heap.insert(next_var)
+        for level in range(1, self.trail.decision_level()+1):
+            if self.trail.level_size(level) == 0:
+                continue
+            if self.var_activities[abs(self.trail.decision_lit(level))] < self.var_activities[next_var]:
+                return level - 1
+        return self.trail.decision_level()
+    def restart(self):
+        restart_level = self.get_restart_level()
+        logging.debug("Restart #{} to level {}".format(self.restart_policy.num_restarts+1, restart_level))
+        self.backtrack(restart_level)
+        if self.rephase is not None:
+            self.rephase_saved_phases()
+        self.restart_policy.on_restart()
+    def grow_vars(self, num_vars):
+        if num_vars <= self.num_vars:
+            return
+        num_new_vars = num_vars - self.num_vars
+        self.num_vars = num_vars
+        self.trail.grow(num_vars)
+        self.seen.extend([False] * num_new_vars)
+        self.saved_phases.extend([-1] * num_new_vars)
+        self.target_phases.extend([-1] * num_new_vars)
+        self.best_phases.extend([-1] * num_new_vars)
+        if self.var_heap is not None:
+            self.var_activities.extend([0.0] * num_new_vars)
+            self.var_heap.grow(num_vars)
+    def add_vars(self, vars):
+        new_vars = sorted(set(var for var in vars if var not in self.lit_clause_map))
+        if not new_vars:
+            return
+        self.grow_vars(new_vars[-1])
+        for var in new_vars:
+            self.atomic_props.append(var)
+            self.lit_clause_map[var] = []
+            self.lit_clause_map[-var] = []
+            if self.var_heap is not None:
+                self.var_heap.insert(var)
+        if self.residual_formula is not None:
+            self.residual_formula.grow(new_vars[-1])
+    def add_clause(self, clause):
+        # Incremental use: the clause is part of the formula for every following solve call
+        clause = list(dict.fromkeys(clause))
+        self.reset_search()
+        self.add_vars([abs(lit) for lit in clause])
+        clause_id = self.clause_db.add_clause(clause)
+        for lit in clause:
+            self.lit_clause_map[lit].append(clause_id)
+        if self.residual_formula is not None:
+            self.residual_formula.add_clause(clause)
+        return clause_id
+    def reset_search(self):
+        # Undo the whole trail, level 0 included, since pure var assignments and assumptions
+        # only hold for one solve call. Learnt clauses and heuristic state are kept.
+        undone_lits = self.trail.clear()
+        if self.residual_formula is not None:
+            self.residual_formula.cancel(0)
+        if self.var_heap is not None:
+            for lit in undone_lits:
+                self.var_heap.insert(abs(lit))
+        if self.phase_saving:
+            for lit in undone_lits:
+                self.saved_phases[abs(lit)] = 1 if lit > 0 else 0
+        self.conflict_clause_id = NO_REASON
+    def decide_assumption(self):
+        # Returns False when the next assumption is already false. Assumptions that already
+        # hold get an empty decision level so that level i+1 always belongs to assumption i.
+        assumption = self.assumptions[self.trail.decision_level()]
+        if self.trail.values[assumption] == 0:
+            self.failed_assumptions = self.analyse_final(assumption)
+            return False
+        self.trail.new_level()
+        self.assign_lit(assumption)
+        return True
+    def analyse_final(self, assumption):
+        # Assumptions whose decisions imply the negation of the failed assumption
+        trail_lits, levels, reasons = self.trail.lits, self.trail.levels, self.trail.reasons
+        lits, seen = self.clause_db.lits, self.seen
+        failed_assumptions = [assumption]
+        if levels[abs(assumption)] == 0:
+            return failed_assumptions
+        seen[abs(assumption)] = True
+        for index in range(len(trail_lits)-1, self.trail.level_limits[0]-1, -1):
+            var = abs(trail_lits[index])
+            if not seen[var]:
+                continue
+            if reasons[var] == NO_REASON:
+                if trail_lits[index] != -assumption:
+                    failed_assumptions.append(trail_lits[index])
+            else:
+                for i in self.clause_db.clause_range(reasons[var]):
+                    if levels[abs(lits[i])] > 0:
+                        seen[abs(lits[i])] = True
+            seen[var] = False
+        return failed_assumptions
+    def solve(self, assumptions=None):
+        self.reset_search()
+        self.assumptions = list(assumptions) if assumptions else []
+        self.failed_assumptions = []
+        self.add_vars([abs(lit) for lit in self.assumptions])
+        self.search_start_time = time.perf_counter()
+        metric = super(CDCL, self).solve()
+        metric.num_restarts = self.restart_policy.num_restarts
+        metric.restart_intervals = self.restart_policy.restart_intervals
+        metric.num_learnt_clauses = self.clause_db.num_learnt
+        metric.max_learnt_clauses = self.max_learnt_clauses
+        metric.num_deleted_clauses = self.num_deleted_clauses
+        metric.num_reductions = self.num_reductions
+        metric.peak_clause_db_bytes = max(self.peak_clause_db_bytes, self.clause_db.memory_bytes())
+        metric.num_inprocessings = self.num_inprocessings
+        metric.num_root_satisfied_clauses = self.num_root_satisfied_clauses
+        metric.num_root_false_lits = self.num_root_false_lits
+        metric.num_vivified_clauses = self.num_vivified_clauses
+        metric.num_vivified_lits = self.num_vivified_lits
+        metric.inprocess_time = self.inprocess_time
+        metric.num_failed_lits = self.num_failed_lits
+        metric.num_equivalent_vars = self.num_equivalent_vars
+        metric.probe_time = self.probe_time
+        if self.clause_sharing is not None:
+            metric.num_exported_clauses = self.clause_sharing.num_exported
+            metric.num_imported_clauses = self.clause_sharing.num_imported
+            metric.num_useful_imports = self.clause_sharing.num_useful
+        return metric
     def solve_sat(self):
-        self.level = 0
         sat = False
-        while not sat:
-            self.assign_pure_vars(self.level)
-            conflict = self.deduce(self.level)
+        conflict_free = self.assign_unit_clauses()
+        while conflict_free and not sat:
+            level = self.trail.decision_level()
+            start_ns = time.perf_counter_ns()
+            self.assign_pure_vars(level)
+            propagate_start_ns = time.perf_counter_ns()
+            conflict = self.deduce(level)
+            end_ns = time.perf_counter_ns()
+            self.decide_ns += propagate_start_ns - start_ns
+            self.propagate_ns += end_ns - propagate_start_ns
+            if not conflict and level == 0 and self.clause_sharing is not None:
+                if not self.import_shared_clauses():
+                    break
+                if self.trail.propagated < len(self.trail.lits):
+                    continue
+            if not conflict and level == 0 and self.inprocessing and self.num_conflicts >= self.next_inprocess:
+                if not self.inprocess():
+                    break
+                if self.trail.propagated < len(self.trail.lits):
+                    continue
             if conflict:
-                if self.level == 0:
+                if level == 0:
                     sat = False
                     break
                 self.num_conflicts += 1
-                learnt_clause, backtrack_level = self.conflict_analyse(self.level)
-                self.update_learnt_clause(learnt_clause)
-                forced_assign_var, forced_assign_var_value = self.backtrack(backtrack_level, self.level)
-                if backtrack_level != 0:
-                    self._force_assign_var(forced_assign_var, backtrack_level, forced_assign_var_value)
-                    self.update_newly_assigned_vars([forced_assign_var], True)
-                else:
-                    single_lit = learnt_clause[0]
-                    self.assign_var(abs(single_lit), 0, 1 if single_lit > 0 else 0)
-                    self.update_newly_assigned_vars([abs(single_lit)], True)
-                self.level = backtrack_level
-                if self.branching_heuristic == "cvsids" or self.branching_heuristic == "mvsids":
+                start_ns = end_ns
+                learnt_clause, backtrack_level, lbd = self.conflict_analyse(level)
+                self.num_learnt_total += 1
+                self.num_learnt_lits += len(learnt_clause)
+                self.sum_backjump_distance += level - backtrack_level
+                self.max_backjump_distance = max(self.max_backjump_distance, level - backtrack_level)
+                if self.rephase is not None:
+                    self.update_target_phases(self.trail.level_limits[level-1])
+                clause_id = self.update_learnt_clause(learnt_clause, lbd)
+                if self.clause_sharing is not None:
+                    self.clause_sharing.export_clause(learnt_clause, lbd)
+                self.backtrack(backtrack_level)
+                self.assign_lit(learnt_clause[0], clause_id)
+                if self.branching_heuristic in VSIDS_HEURISTICS:
                     self.update_var_activities(learnt_clause)
+                self.clause_bonus /= self.clause_decay
+                self.max_learnt_clauses = max(self.max_learnt_clauses, self.clause_db.num_learnt)
+                self.restart_policy.on_conflict(lbd)
+                if self.reduce_interval > 0 and self.num_conflicts >= self.next_reduce:
+                    self.reduce_learnt_clauses()
+                self.analyze_ns += time.perf_counter_ns() - start_ns
+            elif self.restart_policy.should_restart():
+                self.restart()
+            elif level < len(self.assumptions):
+                if not self.decide_assumption():
+                    break
             else:
-                self.level += 1
-                sat, next_var = self.force_assign_var(self.level)
-                self.update_newly_assigned_vars([next_var], False)
+                start_ns = time.perf_counter_ns()
+                sat, next_var = self.force_assign_var(level+1)
+                self.decide_ns += time.perf_counter_ns() - start_ns
         if sat:
             logging.debug("SAT")
         else:
@@ -1,61 +1,95 @@
 from cdcl import CDCL
 import logging
-import copy
-import numpy as np
 
 class CDCL_WL(CDCL):
-    def __init__(self, formula, atomic_props, log_level=None, log_file=None, branching_heuristic=None, model_path=None):
-        super(CDCL_WL, self).__init__(formula, atomic_props, log_level, log_file, branching_heuristic, model_path)
-        self.init_hash_refs_map()
-    def init_hash_refs_map(self):
-        self.hash_refs_map = {}
-        for clause_hash, clause in self.hash_clause_map.items():
-            self.hash_refs_map[clause_hash] = [0, len(clause)-1]
-    def shorten_formula(self, formula, assignment):
-        shortened_formula = []
-        for i, clause in enumerate(formula):
-            shortened_clause = []
-            if self.check_clause_status_wrapper(self.clause_idx_hash_map[i])[0] == "sat":
-                continue
-            for lit in clause:
-                if self.compute_val(lit, assignment) == -1:
-                    shortened_clause.append(lit)
-            shortened_formula.append(shortened_clause)
-        return shortened_formula
-    def assign_var(self, var, level, value):
-        assignable = super(CDCL_WL, self).assign_var(var, level, value)
-        if assignable:
-            true_lit = var if self.assignments[var][0] > 0 else -var
-            for clause_idx, clause_hash in enumerate(self.lit_hash_map[true_lit]):
-                if self.check_clause_status_wrapper(clause_hash)[0] != "sat":
-                    clause = self.hash_clause_map[clause_hash]
-                    self.hash_refs_map[clause_hash][0] = clause.index(true_lit)
-        return assignable
-    def update_learnt_clause(self, learnt_clause):
-        clause_hash = super(CDCL_WL, self).update_learnt_clause(learnt_clause)
-        self.hash_refs_map[clause_hash] = [0, len(learnt_clause)-1]
-        return clause_hash
-    def check_clause_status(self, clause_hash):
-        refs = self.hash_refs_map[clause_hash]
-        clause = self.hash_clause_map[clause_hash]
-        ref_vals = [self.compute_val(clause[refs[0]], self.assignments), self.compute_val(clause[refs[1]], self.assignments)]
-        if ref_vals[0] == 1 or ref_vals[1] == 1:
-            return "sat", [], 0
-        for i, ref in enumerate(refs):
-            if ref_vals[i] == 0:
-                for new_idx, lit in enumerate(clause):
-                    lit_val = self.compute_val(lit, self.assignments)
-                    if lit_val != 0 and new_idx not in refs:
-                        refs[i] = new_idx
-                        if lit_val == 1:
-                            return "sat", [], 0
-        ref_vals = [self.compute_val(clause[refs[0]], self.assignments), self.compute_val(clause[refs[1]], self.assignments)]
-        num_false_lits = ref_vals.count(0)
-        if num_false_lits == 0:
-            return "sat-unassigned", [], 0
-        elif num_false_lits == 1:
-            unit_lit = clause[refs[1-ref_vals.index(0)]]
-            return "unit", clause, unit_lit
-        elif num_false_lits == 2:
-            return "conflict", clause, 0
-        raise Exception("Unaccounted clause staus: val_ref0 {}, val_ref1 {}, refs {}, clause {}".format(ref_vals[0], ref_vals[1], refs, clause))
\ No newline at end of file
+    def __init__(self, formula, atomic_props, log_level=None, log_file=None, branching_heuristic=None, model_path=None,
+                 **kwargs):
+        super(CDCL_WL, self).__init__(formula, atomic_props, log_level, log_file, branching_heuristic, model_path, **kwargs)
+        self.init_watches()
+    def init_watches(self):
+        # watches[lit] holds (clause_id, blocker) pairs of the clauses watching lit. The two
+        # watched literals of a clause are kept at its first two positions in the clause arena.
+        self.watches = {}
+        for var in self.atomic_props:
+            self.watches[var] = []
+            self.watches[-var] = []
+        for clause_id in self.clause_db.clause_ids():
+            self.watch_clause(clause_id)
+    def watch_clause(self, clause_id):
+        if self.clause_db.clause_size(clause_id) < 2:
+            return
+        lits = self.clause_db.lits
+        start = self.clause_db.offsets[clause_id]
+        self.watches[lits[start]].append((clause_id, lits[start+1]))
+        self.watches[lits[start+1]].append((clause_id, lits[start]))
+    def add_vars(self, vars):
+        for var in vars:
+            if var not in self.watches:
+                self.watches[var] = []
+                self.watches[-var] = []
+        super(CDCL_WL, self).add_vars(vars)
+    def add_clause(self, clause):
+        clause_id = super(CDCL_WL, self).add_clause(clause)
+        self.watch_clause(clause_id)
+        return clause_id
+    def remap_clause_ids(self, remap):
+        super(CDCL_WL, self).remap_clause_ids(remap)
+        self.init_watches()
+    def update_learnt_clause(self, learnt_clause, lbd=0, imported=False):
+        clause_id = super(CDCL_WL, self).update_learnt_clause(learnt_clause, lbd, imported)
+        self.watch_clause(clause_id)
+        return clause_id
+    def deduce(self, level):
+        lits, offsets, sizes = self.clause_db.lits, self.clause_db.offsets, self.clause_db.sizes
+        trail = self.trail
+        values = trail.values
+        while trail.propagated < len(trail.lits):
+            false_lit = -trail.lits[trail.propagated]
+            trail.propagated += 1
+            watchers = self.watches[false_lit]
+            num_watchers = len(watchers)
+            i = j = 0
+            while i < num_watchers:
+                watcher = watchers[i]
+                i += 1
+                clause_id, blocker = watcher
+                if values[blocker] == 1:
+                    watchers[j] = watcher
+                    j += 1
+                    continue
+                start = offsets[clause_id]
+                if lits[start] == false_lit:
+                    lits[start] = lits[start+1]
+                    lits[start+1] = false_lit
+                first = lits[start]
+                first_val = values[first]
+                if first != blocker and first_val == 1:
+                    watchers[j] = (clause_id, first)
+                    j += 1
+                    continue
+                new_watch_found = False
+                for k in range(start+2, start+sizes[clause_id]):
+                    if values[lits[k]] != 0:
+                        lits[start+1] = lits[k]
+                        lits[k] = false_lit
+                        self.watches[lits[start+1]].append((clause_id, first))
+                        new_watch_found = True
+                        break
+                if new_watch_found:
+                    continue
+                watchers[j] = (clause_id, first)
+                j += 1
+                if first_val == 0:
+                    while i < num_watchers:
+                        watchers[j] = watchers[i]
+                        j += 1
+                        i += 1
+                    del watchers[j:]
+                    logging.debug("Conflict detected in clause {}".format(clause_id))
+                    self.conflict_clause_id = clause_id
+                    return True
+                if first_val == -1:
+                    self.num_propagations += 1
+                    trail.assign(first, clause_id)
+            del watchers[j:]
+        return False
@@ -0,0 +1,93 @@
+from array import array
+
+# learnt flags: imported clauses of other workers become LEARNT once used in conflict analysis
+ORIGINAL, LEARNT, IMPORTED = 0, 1, 2
+
+class ClauseDB(object):
+    """Clause arena addressed by integer clause ids.
+
+    Literals of every clause are stored contiguously in one flat array, the
+    clause with id i lives at lits[offsets[i]:offsets[i]+sizes[i]]. Deleting
+    clauses compacts the arena, so clause ids are only stable between calls
+    to delete_clauses.
+    """
+    def __init__(self, formula=None):
+        self.lits = array('i')
+        self.offsets = array('l')
+        self.sizes = array('i')
+        self.learnt = array('b')
+        self.lbds = array('i')
+        self.activities = array('d')
+        self.num_learnt = 0
+        if formula is not None:
+            for clause in formula:
+                self.add_clause(clause)
+    def add_clause(self, clause, learnt=False, lbd=0, imported=False):
+        clause_id = len(self.offsets)
+        self.offsets.append(len(self.lits))
+        self.sizes.append(len(clause))
+        self.lits.extend(clause)
+        self.learnt.append(IMPORTED if imported else LEARNT if learnt else ORIGINAL)
+        self.lbds.append(lbd)
+        self.activities.append(0.0)
+        if learnt:
+            self.num_learnt += 1
+        return clause_id
+    def get_clause(self, clause_id):
+        start = self.offsets[clause_id]
+        return self.lits[start:start+self.sizes[clause_id]].tolist()
+    def clause_range(self, clause_id):
+        start = self.offsets[clause_id]
+        return range(start, start+self.sizes[clause_id])
+    def shrink_clause(self, clause_id, clause):
+        # Rewrites a clause with a subset of its lits in place, the freed slots of the arena
+        # are only reclaimed when delete_clauses moves the clause
+        start = self.offsets[clause_id]
+        self.lits[start:start+len(clause)] = array('i', clause)
+        self.sizes[clause_id] = len(clause)
+        self.lbds[clause_id] = min(self.lbds[clause_id], len(clause))
+    def clause_size(self, clause_id):
+        return self.sizes[clause_id]
+    def is_learnt(self, clause_id):
+        return self.learnt[clause_id] != ORIGINAL
+    def delete_clauses(self, deleted_ids):
+        # Compact the arena without the deleted clauses and return the remapping
+        # old id -> new id (-1 for deleted clauses). Clauses before the first
+        # deleted id keep their ids and are moved with slices.
+        if not deleted_ids:
+            return list(self.clause_ids())
+        first_id = min(deleted_ids)
+        first_lit = self.offsets[first_id]
+        remap = list(range(first_id)) + [-1] * (len(self.offsets) - first_id)
+        old_lits, old_offsets, old_sizes = self.lits, self.offsets, self.sizes
+        old_learnt, old_lbds, old_activities = self.learnt, self.lbds, self.activities
+        self.lits = old_lits[:first_lit]
+        self.offsets = old_offsets[:first_id]
+        self.sizes = old_sizes[:first_id]
+        self.learnt = old_learnt[:first_id]
+        self.lbds = old_lbds[:first_id]
+        self.activities = old_activities[:first_id]
+        for clause_id in range(first_id, len(old_offsets)):
+            if clause_id in deleted_ids:
+                if old_learnt[clause_id]:
+                    self.num_learnt -= 1
+                continue
+            remap[clause_id] = len(self.offsets)
+            start = old_offsets[clause_id]
+            self.offsets.append(len(self.lits))
+            self.lits.extend(old_lits[start:start+old_sizes[clause_id]])
+            self.sizes.append(old_sizes[clause_id])
+            self.learnt.append(old_learnt[clause_id])
+            self.lbds.append(old_lbds[clause_id])
+            self.activities.append(old_activities[clause_id])
+        return remap
+    def memory_bytes(self):
+        return sum(arr.itemsize * len(arr) for arr in
+                   (self.lits, self.offsets, self.sizes, self.learnt, self.lbds, self.activities))
+    def clause_ids(self):
+        return range(len(self.offsets))
+    def __iter__(self):
+        for clause_id in self.clause_ids():
+            yield self.get_clause(clause_id)
+    def __len__(self):
+        return len(self.offsets)
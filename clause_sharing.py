@@ -0,0 +1,86 @@
+import multiprocessing
+
+class ClauseExchange(object):
+    """Ring buffer of learnt clauses in shared memory, for workers forked after it is built.
+
+    Each of the capacity slots holds the sender's id, the clause's lbd and size, then up to
+    max_size lits. The total number of clauses ever written is the head, slot head % capacity
+    is written next. Writers and batch reads take the lock, readers only poll the head
+    without it. A reader more than capacity clauses behind loses the overwritten ones.
+    """
+    def __init__(self, capacity=4096, max_size=8):
+        self.capacity = capacity
+        self.max_size = max_size
+        self.slot_size = max_size + 3
+        self.slots = multiprocessing.RawArray("i", capacity * self.slot_size)
+        self.head = multiprocessing.RawValue("q", 0)
+        self.lock = multiprocessing.Lock()
+    def put(self, sender_id, clause, lbd):
+        with self.lock:
+            start = (self.head.value % self.capacity) * self.slot_size
+            self.slots[start:start+3] = [sender_id, lbd, len(clause)]
+            self.slots[start+3:start+3+len(clause)] = clause
+            self.head.value += 1
+    def read(self, position, limit):
+        # Returns the clauses written from position on, at most limit of them, as
+        # (sender id, lbd, clause) tuples, and the position to read from next
+        if self.head.value == position:
+            return [], position
+        entries = []
+        with self.lock:
+            head = self.head.value
+            position = max(position, head - self.capacity)
+            end = min(head, position + limit)
+            for index in range(position, end):
+                start = (index % self.capacity) * self.slot_size
+                sender_id, lbd, size = self.slots[start:start+3]
+                entries.append((sender_id, lbd, self.slots[start+3:start+3+size]))
+        return entries, end
+
+class ClauseSharing(object):
+    """One worker's end of a ClauseExchange.
+
+    Learnt clauses of at most max_size lits and lbd at most max_lbd are exported, and at
+    most import_limit clauses of the other workers are imported per call. A clause with the
+    same lits as one already exported or imported is dropped on both sides.
+    """
+    def __init__(self, exchange, worker_id, max_lbd=4, import_limit=100):
+        self.exchange = exchange
+        self.worker_id = worker_id
+        self.max_size = exchange.max_size
+        self.max_lbd = max_lbd
+        self.import_limit = import_limit
+        self.position = 0
+        self.known_clauses = set()
+        self.num_exported = 0
+        self.num_imported = 0
+        self.num_duplicates = 0
+        self.num_dropped = 0
+        self.num_useful = 0
+    def export_clause(self, clause, lbd):
+        if len(clause) > self.max_size or lbd > self.max_lbd:
+            return
+        key = frozenset(clause)
+        if key in self.known_clauses:
+            return
+        self.known_clauses.add(key)
+        self.exchange.put(self.worker_id, clause, lbd)
+        self.num_exported += 1
+    def import_clauses(self):
+        # Returns the new (clause, lbd) pairs of the other workers
+        position = self.position
+        entries, self.position = self.exchange.read(position, self.import_limit)
+        if entries:
+            self.num_dropped += self.position - len(entries) - position
+        clauses = []
+        for sender_id, lbd, clause in entries:
+            if sender_id == self.worker_id:
+                continue
+            key = frozenset(clause)
+            if key in self.known_clauses:
+                self.num_duplicates += 1
+                continue
+            self.known_clauses.add(key)
+            clauses.append((clause, lbd))
+        self.num_imported += len(clauses)
+        return clauses
@@ -1,11 +1,38 @@
+import gc
+
 class CNF(object):
-    def __init__(self, num_props=0, num_clauses=0, formula=[]):
-        self.formula = formula
+    """A CNF formula, as lists of clauses or in flat form.
+
+    In flat form, lits holds the literals of every clause back to back and clause i is
+    lits[offsets[i]:offsets[i+1]]. The list form is only built when formula is first used.
+    """
+    def __init__(self, num_props=0, num_clauses=0, formula=None, lits=None, offsets=None):
+        self._formula = formula
+        self.lits = lits
+        self.offsets = offsets
         self.num_props = num_props
         self.num_clauses = num_clauses
+    @property
+    def formula(self):
+        if self._formula is None:
+            self._formula = [] if self.lits is None else self.flat_to_formula(self.lits, self.offsets)
+        return self._formula
+    @formula.setter
+    def formula(self, formula):
+        self._formula = formula
+    def flat_to_formula(self, lits, offsets):
+        lits, offsets = lits.tolist(), offsets.tolist()
+        # Allocating a list per clause would otherwise trigger many useless gc passes
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return [lits[start:end] for start, end in zip(offsets, offsets[1:])]
+        finally:
+            if gc_enabled:
+                gc.enable()
     def __str__(self):
         return str({
             "num_props": self.num_props,
             "num_clauses": self.num_clauses,
             "formula": self.formula
-        })
\ No newline at end of file
+        })
@@ -0,0 +1,131 @@
+import logging
+import multiprocessing
+import os
+import time
+from cdcl_wl import CDCL_WL
+from metrics import Metrics
+
+CUBE_SOLVER = None
+
+def init_cube_worker(formula, atomic_props, branching_heuristic, solver_kwargs):
+    # One incremental solver per worker, its learnt clauses are kept from cube to cube
+    global CUBE_SOLVER
+    CUBE_SOLVER = CDCL_WL(formula, atomic_props, branching_heuristic=branching_heuristic, **solver_kwargs)
+
+def solve_cube(indexed_cube):
+    cube_index, cube = indexed_cube
+    start_time = time.perf_counter()
+    num_conflicts, num_decisions = CUBE_SOLVER.num_conflicts, CUBE_SOLVER.pick_branching_num
+    metric = CUBE_SOLVER.solve(cube)
+    model = CUBE_SOLVER.get_model() if metric.sat else None
+    return (cube_index, metric.sat, time.perf_counter() - start_time, os.getpid(),
+            CUBE_SOLVER.num_conflicts - num_conflicts, CUBE_SOLVER.pick_branching_num - num_decisions, model)
+
+class CubeAndConquer(object):
+    """Cube-and-conquer for single hard instances.
+
+    The cube phase walks a decision tree down to cube_depth branching vars, picked by
+    cube_heuristic on a CDCL_WL solver (up, gup and sup through the lookahead engine, which
+    also turns failed literals into single-branch steps). Branches refuted by propagation
+    are dropped, the leaves are the cubes. Cubes are then handed out one at a time to a pool
+    of num_workers processes, each solving them under assumptions with its own incremental
+    CDCL_WL, so a worker done with an easy cube takes the next one. The first SAT cube stops
+    the pool.
+    """
+    def __init__(self, formula, atomic_props, branching_heuristic=None, num_workers=None, cube_depth=8,
+                 cube_heuristic="up", **solver_kwargs):
+        self.formula = formula
+        self.atomic_props = sorted(set(atomic_props) | set(abs(lit) for clause in formula for lit in clause))
+        self.branching_heuristic = branching_heuristic
+        self.num_workers = num_workers if num_workers else multiprocessing.cpu_count()
+        self.cube_depth = cube_depth
+        self.cube_heuristic = cube_heuristic
+        self.solver_kwargs = solver_kwargs
+        self.assignments = {}
+        self.num_refuted_cubes = 0
+        self.num_cube_decisions = 0
+        self.cube_time = 0.0
+        self.cube_results = []
+    def propagate_cube(self, solver, cube):
+        # Returns False if the cube is refuted by unit propagation alone
+        solver.backtrack(0)
+        for lit in cube:
+            lit_val = solver.trail.values[lit]
+            if lit_val == 0:
+                return False
+            if lit_val == 1:
+                continue
+            solver.trail.new_level()
+            solver.assign_lit(lit)
+            if solver.deduce(solver.trail.decision_level()):
+                return False
+        return True
+    def generate_cubes(self):
+        solver = CDCL_WL([list(clause) for clause in self.formula], self.atomic_props, branching_heuristic=self.cube_heuristic)
+        if not solver.assign_unit_clauses() or solver.deduce(0):
+            return []
+        cubes = []
+        # Each entry is a cube to expand and its number of branching decisions
+        stack = [([], 0)]
+        while stack:
+            cube, depth = stack.pop()
+            if not self.propagate_cube(solver, cube):
+                self.num_refuted_cubes += 1
+                continue
+            if depth >= self.cube_depth:
+                cubes.append(cube)
+                continue
+            next_var, _ = solver.assign_next_var(solver.clause_db, solver.assignments, True)
+            self.num_cube_decisions += 1
+            if next_var == 0:
+                cubes.append(cube)
+                continue
+            forced_value = solver.get_forced_value(next_var)
+            if forced_value != -1:
+                stack.append((cube + [next_var if forced_value == 1 else -next_var], depth))
+                continue
+            stack.append((cube + [-next_var], depth + 1))
+            stack.append((cube + [next_var], depth + 1))
+        return cubes
+    def solve(self):
+        start_time = time.perf_counter()
+        cubes = self.generate_cubes()
+        self.cube_time = time.perf_counter() - start_time
+        logging.debug("{} cubes, {} refuted while cubing".format(len(cubes), self.num_refuted_cubes))
+        self.num_cubes = len(cubes)
+        sat = False
+        if cubes:
+            pool = multiprocessing.Pool(min(self.num_workers, len(cubes)), initializer=init_cube_worker,
+                                        initargs=(self.formula, self.atomic_props, self.branching_heuristic, self.solver_kwargs))
+            try:
+                for result in pool.imap_unordered(solve_cube, enumerate(cubes), chunksize=1):
+                    self.cube_results.append(result)
+                    if result[1]:
+                        sat = True
+                        self.assignments = result[6]
+                        break
+            finally:
+                pool.terminate()
+                pool.join()
+        exec_time = time.perf_counter() - start_time
+        pick_branching_num = self.num_cube_decisions + sum(result[5] for result in self.cube_results)
+        return Metrics(sat, exec_time, pick_branching_num)
+    def worker_loads(self):
+        # {worker pid: [cubes solved, busy seconds]}
+        loads = {}
+        for _, _, cube_time, pid, _, _, _ in self.cube_results:
+            load = loads.setdefault(pid, [0, 0.0])
+            load[0] += 1
+            load[1] += cube_time
+        return loads
+    def report(self):
+        lines = ["Cubes: {} generated, {} refuted while cubing, {} solved in {} workers, cubing {:.3f}s".format(
+            self.num_cubes, self.num_refuted_cubes, len(self.cube_results), self.num_workers, self.cube_time)]
+        loads = self.worker_loads()
+        for pid, (num_cubes, busy_time) in sorted(loads.items()):
+            lines.append("  worker {:<8} {:>6} cubes {:>10.3f}s".format(pid, num_cubes, busy_time))
+        if loads:
+            busy_times = [busy_time for _, busy_time in loads.values()]
+            mean_busy_time = sum(busy_times) / len(busy_times)
+            lines.append("Load balance (max/mean busy time): {:.2f}".format(max(busy_times) / mean_busy_time if mean_busy_time > 0 else 1.0))
+        return "\n".join(lines)
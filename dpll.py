@@ -1,92 +1,194 @@
-import datetime
-import time
-import random
 import logging
+import time
 from base_solver import BaseSolver
-import copy
+from branching_scores import BranchingScores, INCREMENTAL_HEURISTICS
+from residual_formula import ResidualFormula
+from lookahead import Lookahead, LOOKAHEAD_HEURISTICS
 
 class DPLL(BaseSolver):
+    """Iterative DPLL over a single formula representation.
+
+    Literals are assigned and undone in place along self.trail. Per clause, num_true counts
+    its true literals and num_unassigned its unassigned ones, lit_counts[lit] is the number
+    of unsatisfied clauses containing lit. Each decision level first assigns the pure
+    literals of the residual formula, then unit propagates, as the recursive version did.
+    """
+    def __init__(self, formula, atomic_props, log_level=None, log_file=None, branching_heuristic=None, model_path=None,
+                 lookahead_budget=20):
+        super(DPLL, self).__init__(formula, atomic_props, log_level, log_file, branching_heuristic, model_path)
+        self.init_clauses()
+        if branching_heuristic in LOOKAHEAD_HEURISTICS:
+            self.lookahead = Lookahead(self, lookahead_budget)
     def get_assign_value(self, next_var):
         return 1
-    def get_lit_counts(self, formula):
-        ap_counts = {}
-        for clause in formula:
-            for ap in clause:
-                ap_counts[ap] = 0 if ap not in ap_counts else ap_counts[ap]
-                ap_counts[ap] += 1
-        return ap_counts
-    def get_pure_lits(self, formula):
-        lit_counts = self.get_lit_counts(formula)
-        pure_lits = [lit for lit, _ in lit_counts.items() if -lit not in lit_counts]
-        logging.debug("Pure aps in formula {}: {}".format(formula, pure_lits))
+    def init_clauses(self):
+        # Counters count each lit once per clause, so repeated lits are merged and
+        # tautologies, never false, are dropped
+        self.clauses = []
+        for clause in self.formula:
+            clause = list(dict.fromkeys(clause))
+            if not any(-lit in clause for lit in clause):
+                self.clauses.append(clause)
+        self.num_true = [0] * len(self.clauses)
+        self.num_unassigned = [len(clause) for clause in self.clauses]
+        self.num_unsat_clauses = len(self.clauses)
+        self.lit_clause_map = {}
+        self.lit_counts = {}
+        for var in self.atomic_props:
+            self.lit_clause_map[var] = []
+            self.lit_clause_map[-var] = []
+            self.lit_counts[var] = 0
+            self.lit_counts[-var] = 0
+        for clause_id, clause in enumerate(self.clauses):
+            for lit in clause:
+                self.lit_clause_map[lit].append(clause_id)
+                self.lit_counts[lit] += 1
+        self.assignments = {}
+        self.trail = []
+        self.unit_clause_ids = []
+        self.branching_scores = None
+        num_vars = max(self.atomic_props) if self.atomic_props else 0
+        if self.branching_heuristic in INCREMENTAL_HEURISTICS:
+            self.branching_scores = BranchingScores(self.branching_heuristic, num_vars, self.clauses)
+            self.residual_formula = self.branching_scores
+        else:
+            self.residual_formula = ResidualFormula(num_vars, self.clauses)
+    def assign_lit(self, lit):
+        # Returns False if the assignment falsifies a clause. Counters are updated for
+        # every clause anyway so that undo_lit restores them exactly.
+        self.trail.append(lit)
+        self.assignments[abs(lit)] = 1 if lit > 0 else 0
+        num_true, num_unassigned, lit_counts = self.num_true, self.num_unassigned, self.lit_counts
+        for clause_id in self.lit_clause_map[lit]:
+            num_true[clause_id] += 1
+            if num_true[clause_id] == 1:
+                self.num_unsat_clauses -= 1
+                for clause_lit in self.clauses[clause_id]:
+                    lit_counts[clause_lit] -= 1
+        no_conflict = True
+        for clause_id in self.lit_clause_map[-lit]:
+            num_unassigned[clause_id] -= 1
+            if num_true[clause_id] == 0:
+                if num_unassigned[clause_id] == 0:
+                    no_conflict = False
+                elif num_unassigned[clause_id] == 1:
+                    self.unit_clause_ids.append(clause_id)
+        return no_conflict
+    def undo_lit(self, lit):
+        num_true, num_unassigned, lit_counts = self.num_true, self.num_unassigned, self.lit_counts
+        for clause_id in self.lit_clause_map[-lit]:
+            num_unassigned[clause_id] += 1
+        for clause_id in self.lit_clause_map[lit]:
+            num_true[clause_id] -= 1
+            if num_true[clause_id] == 0:
+                self.num_unsat_clauses += 1
+                for clause_lit in self.clauses[clause_id]:
+                    lit_counts[clause_lit] += 1
+        del self.assignments[abs(lit)]
+    def undo_until(self, trail_size):
+        while len(self.trail) > trail_size:
+            self.undo_lit(self.trail.pop())
+        del self.unit_clause_ids[:]
+        self.residual_formula.cancel(trail_size)
+    def get_pure_lits(self):
+        pure_lits = []
+        for var in self.atomic_props:
+            if var in self.assignments:
+                continue
+            if self.lit_counts[var] > 0 and self.lit_counts[-var] == 0:
+                pure_lits.append(var)
+            elif self.lit_counts[-var] > 0 and self.lit_counts[var] == 0:
+                pure_lits.append(-var)
         return pure_lits
-    def resolve_by_pure_aps(self, formula):
-        pure_aps = self.get_pure_lits(formula)
-        for pure_ap in pure_aps:
-            formula, _, unsat = self.resolve_by_lit(formula, pure_ap)
-            if unsat:
+    def get_unit_lit(self, clause_id):
+        for lit in self.clauses[clause_id]:
+            if abs(lit) not in self.assignments:
+                return lit
+        return 0
+    def resolve_by_pure_lits(self):
+        pure_lits = self.get_pure_lits()
+        for pure_lit in pure_lits:
+            if not self.assign_lit(pure_lit):
                 raise Exception("Resolving pure ap should not return UNSAT")
-        return formula, pure_aps, False
-    def resolve_by_unit_propagation(self, formula):
-        assignments = []
-        single_ap_clauses = self.get_unit_lits(formula)
-        while len(single_ap_clauses) > 0:
-            ap = single_ap_clauses[0]
-            formula, _, unsat = self.resolve_by_lit(formula, ap)
-            if unsat:
-                return formula, [], True
-            if not formula:
-                return formula, assignments, False
-            assignments.append(ap)
-            single_ap_clauses = self.get_unit_lits(formula)
-        return formula, assignments, False
-    def debug_msg(self, level, task, formula, assignments, unsat):
-        logging.debug("Level {}, resolution by {}:".format(level, task))
-        logging.debug("- Formula: {}".format(formula))
-        logging.debug("- Assignments: {}".format(assignments))
-        logging.debug("- Unsat: {}".format(unsat))
-    def add_to_assignments(self, assignments, lits):
-        copied_assignments = copy.deepcopy(assignments)
-        for lit in lits:
-            copied_assignments[abs(lit)] = 1 if lit > 0 else 0
-        return copied_assignments
-    def _solve(self, level, formula, assignments={}):
-        formula, pure_aps, unsat = self.resolve_by_pure_aps(formula)
-        if unsat:
-            raise Exception("Resolving pure aps should not return UNSAT")
-        assignments = self.add_to_assignments(assignments, pure_aps)
-        self.debug_msg(level, "pure aps", formula, assignments, unsat)
-        formula, new_assignments, unsat = self.resolve_by_unit_propagation(formula)
-        assignments = self.add_to_assignments(assignments, new_assignments)
-        self.debug_msg(level, "unit propagation", formula, assignments, unsat)
-        if unsat:
-            return formula, assignments, True
-        if not formula:
-            return formula, assignments, False
-        next_ap, next_var_val = self.assign_next_var(formula, assignments)
-        next_lit = next_ap if next_var_val == 1 else -next_ap
-        logging.debug("Assigning next ap: {}".format(next_lit))
-        tmp_formula, tmp_assignments, unsat = self.resolve_by_lit(formula, next_lit)
-        self.debug_msg(level, "assigning {}".format(next_lit), tmp_formula, self.add_to_assignments(assignments, tmp_assignments + [next_lit]), unsat)
-        if unsat:
-            raise Exception("Resolving an ap after all unit clauses have been resolved should not return UNSAT")
-        tmp_formula, tmp_assignments, unsat = self._solve(level+1, tmp_formula, self.add_to_assignments(assignments, [next_lit]))
-        self.debug_msg(level, "solving", tmp_formula, tmp_assignments, unsat)
-        if unsat:
-            logging.debug("Assigning {} as next ap returns UNSAT, start backtracking".format(next_lit))
-            tmp_formula, tmp_assignments, unsat = self.resolve_by_lit(formula, -next_lit)
-            self.debug_msg(level, "assigning {}".format(-next_lit), tmp_formula, self.add_to_assignments(assignments, tmp_assignments + [-next_lit]), unsat)
-            if unsat:
-                raise Exception("Resolving an ap after all unit clauses have been resolved should not return UNSAT")
-            tmp_formula, tmp_assignments, unsat = self._solve(level+1, tmp_formula, self.add_to_assignments(assignments, [-next_lit]))
-            self.debug_msg(level, "solving an ap", tmp_formula, tmp_assignments, unsat)
-        return tmp_formula, tmp_assignments, unsat
+        logging.debug("Pure aps: {}".format(pure_lits))
+    def resolve_by_unit_propagation(self):
+        unit_clause_ids = self.unit_clause_ids
+        while len(unit_clause_ids) > 0:
+            clause_id = unit_clause_ids.pop()
+            if self.num_true[clause_id] > 0:
+                continue
+            self.num_propagations += 1
+            if not self.assign_lit(self.get_unit_lit(clause_id)):
+                del unit_clause_ids[:]
+                return True
+        return False
+    def get_trail_lits(self):
+        return self.trail
+    def probe_lit(self, lit):
+        # Lookahead: assigns lit and unit propagates, then undoes both
+        trail_size = len(self.trail)
+        num_propagations = self.num_propagations
+        conflict = not self.assign_lit(lit) or self.resolve_by_unit_propagation()
+        num_implied = len(self.trail) - trail_size - 1
+        self.undo_until(trail_size)
+        self.num_propagations = num_propagations
+        return num_implied, conflict
+    def assign_next_var(self, formula=None, assignments=None, shortened=False):
+        # Decides on the residual formula view, synced to the trail only when a decision is made
+        if self.branching_scores is None:
+            return super(DPLL, self).assign_next_var(self.residual_formula.sync(self.trail), self.assignments)
+        self.pick_branching_num += 1
+        self.branching_scores.sync(self.trail)
+        next_var = self.branching_scores.pick_branching_var()
+        if next_var is None:
+            next_var = self.heuristic_random(None, self.assignments)[0]
+        next_var_val = -1 if next_var == 0 else self.get_assign_value(next_var)
+        logging.debug("Assign {} next as {} at #{}".format(next_var, next_var_val, self.pick_branching_num))
+        return next_var, next_var_val
     def solve_sat(self):
-        assignments = {}
-        _, assignments, unsat = self._solve(0, self.formula, assignments)
-        sat = not unsat
+        if 0 in self.num_unassigned:
+            logging.debug("UNSAT")
+            return False
+        self.unit_clause_ids = [clause_id for clause_id, size in enumerate(self.num_unassigned) if size == 1]
+        # Each decision is [trail size before the decision, decision lit, whether -lit was tried]
+        decisions = []
+        sat = False
+        while True:
+            start_ns = time.perf_counter_ns()
+            self.resolve_by_pure_lits()
+            unsat = self.resolve_by_unit_propagation()
+            end_ns = time.perf_counter_ns()
+            self.propagate_ns += end_ns - start_ns
+            if not unsat:
+                if self.num_unsat_clauses == 0:
+                    sat = True
+                    break
+                next_ap, next_var_val = self.assign_next_var()
+                self.decide_ns += time.perf_counter_ns() - end_ns
+                next_lit = next_ap if next_var_val == 1 else -next_ap
+                logging.debug("Level {}, assigning next ap: {}".format(len(decisions) + 1, next_lit))
+                decisions.append([len(self.trail), next_lit, False])
+                if not self.assign_lit(next_lit):
+                    raise Exception("Resolving an ap after all unit clauses have been resolved should not return UNSAT")
+                continue
+            self.num_conflicts += 1
+            level = len(decisions)
+            while len(decisions) > 0 and decisions[-1][2]:
+                self.undo_until(decisions.pop()[0])
+            if len(decisions) == 0:
+                break
+            decision = decisions[-1]
+            logging.debug("Assigning {} as next ap returns UNSAT, start backtracking".format(decision[1]))
+            self.undo_until(decision[0])
+            decision[1] = -decision[1]
+            decision[2] = True
+            if not self.assign_lit(decision[1]):
+                raise Exception("Resolving an ap after all unit clauses have been resolved should not return UNSAT")
+            self.sum_backjump_distance += level - len(decisions) + 1
+            self.max_backjump_distance = max(self.max_backjump_distance, level - len(decisions) + 1)
+            self.analyze_ns += time.perf_counter_ns() - end_ns
         if sat:
             logging.debug("SAT")
         else:
             logging.debug("UNSAT")
-        return sat
\ No newline at end of file
+        return sat
@@ -1,7 +1,5 @@
 from cdcl_wl import CDCL_WL
 
-from es import einstein
-
 value_list = ["Blend", "Blue Masters", "Dunhill", "Pall Mall", "Prince", 
               "Blue", "Green", "Red", "White", "Yellow",
               "Beer", "Coffee", "Milk", "Tea", "Water",
@@ -1,6 +1,27 @@
 from cnf import CNF
-import re
+import bz2
+import gzip
+import hashlib
+import logging
+import lzma
 import os
+import struct
+import tempfile
+import warnings
+import numpy as np
+
+CHUNK_SIZE = 1 << 22
+COMPRESSED_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+DEFAULT_CACHE_DIR = "cnf_cache"
+CACHE_MAGIC = b"CNFB"
+CACHE_VERSION = 1
+# magic, version, num_props, num_clauses, number of lits, number of offsets
+CACHE_HEADER = struct.Struct("<4sIqqqq")
+
+def open_input(input_path):
+    # Binary file object, decompressing .gz/.bz2/.xz inputs on the fly
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(input_path)[1], open)
+    return opener(input_path, "rb")
 
 class SatWriter(object):
     def write_output(self, output_path, output):
@@ -8,32 +29,137 @@ class SatWriter(object):
             f.write(output)
 
 class SatReader(object):
-    COMMENT_LINE_PATTERN='c.*'
-    INFO_LINE_PATTERN='p\s*cnf\s*(\d*)\s*(\d*)'
-        
+    """Streaming DIMACS reader.
+
+    The input is read in chunks cut at the last line break. Comment, problem and "%" lines
+    are only looked for line by line in the chunks that contain a 'c', 'p' or '%', everything
+    else is tokenized in bulk into int32 tokens. Clauses are delimited by their 0 terminators
+    only, so they may span lines or share one. Everything after a SATLIB "%" line is ignored.
+
+    With a cache_dir, the parsed formula is also saved there in a binary format named after
+    a hash of the input's content: the header, the int32 lits then the int64 clause offsets.
+    Later reads of the same content memory-map that file instead of parsing the input.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
     def read_input(self, input_path):
         print("Read input from file {}".format(input_path))
-        comment_line_regex = re.compile(self.COMMENT_LINE_PATTERN)
-        info_line_regex = re.compile(self.INFO_LINE_PATTERN)
-        formula = []
-        num_props, num_clauses = 0, 0
-
-        with open(input_path, 'r') as input_file:
-            for line in input_file.readlines():
-                line = line.strip()
-                if line == "%" or not line:
-                    continue
-                if not comment_line_regex.match(line):
-                    infos = info_line_regex.match(line)
-                    if infos:
-                        num_props = int(infos.group(1))
-                        num_clauses = int(infos.group(2))
-                    else:
-                        raw_props = line.rstrip('\n').split()
-                        props = []
-                        for prop in raw_props:
-                            prop = int(prop)
-                            if prop != 0:
-                                props.append(prop)
-                        formula.append(props)
-        return CNF(num_props, num_clauses, formula)
+        if not self.cache_dir:
+            return self.read_cnf(input_path)
+        cache_path = self.get_cache_path(input_path)
+        cnf = self.load_cache(cache_path) if os.path.exists(cache_path) else None
+        if cnf is None:
+            cnf = self.read_cnf(input_path)
+            try:
+                self.write_cache(cache_path, cnf)
+            except OSError as e:
+                logging.warning("Could not cache {}: {}".format(input_path, e))
+        return cnf
+    def get_cache_path(self, input_path):
+        content_hash = hashlib.sha256()
+        with open(input_path, "rb") as input_file:
+            chunk = input_file.read(CHUNK_SIZE)
+            while chunk:
+                content_hash.update(chunk)
+                chunk = input_file.read(CHUNK_SIZE)
+        return os.path.join(self.cache_dir, content_hash.hexdigest() + ".cnfb")
+    def load_cache(self, cache_path):
+        # Returns None for a cache file of another version or a truncated one
+        with open(cache_path, "rb") as cache_file:
+            header = cache_file.read(CACHE_HEADER.size)
+        if len(header) != CACHE_HEADER.size:
+            return None
+        magic, version, num_props, num_clauses, num_lits, num_offsets = CACHE_HEADER.unpack(header)
+        lits_end = CACHE_HEADER.size + 4 * num_lits
+        offsets_start = lits_end + (-lits_end) % 8
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or \
+                os.path.getsize(cache_path) != offsets_start + 8 * num_offsets:
+            return None
+        lits = np.memmap(cache_path, dtype=np.int32, mode="r", offset=CACHE_HEADER.size, shape=(num_lits,)) \
+            if num_lits > 0 else np.empty(0, dtype=np.int32)
+        offsets = np.memmap(cache_path, dtype=np.int64, mode="r", offset=offsets_start, shape=(num_offsets,))
+        return CNF(num_props, num_clauses, lits=lits, offsets=offsets)
+    def write_cache(self, cache_path, cnf):
+        # Written to a temporary file first, so concurrent runs never load a partial cache file
+        os.makedirs(self.cache_dir, exist_ok=True)
+        lits = np.ascontiguousarray(cnf.lits, dtype=np.int32)
+        offsets = np.ascontiguousarray(cnf.offsets, dtype=np.int64)
+        lits_end = CACHE_HEADER.size + 4 * len(lits)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cache_file:
+                cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, cnf.num_props, cnf.num_clauses, len(lits), len(offsets)))
+                cache_file.write(lits.tobytes())
+                cache_file.write(b"\0" * ((-lits_end) % 8))
+                cache_file.write(offsets.tobytes())
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    def read_cnf(self, input_path, chunk_size=CHUNK_SIZE):
+        header = [0, 0]
+        token_chunks = []
+        rest = b""
+        with open_input(input_path) as input_file:
+            ended = False
+            while not ended:
+                chunk = input_file.read(chunk_size)
+                if not chunk:
+                    data, rest, ended = rest, b"", True
+                else:
+                    data = rest + chunk
+                    cut = data.rfind(b"\n") + 1
+                    data, rest = data[:cut], data[cut:]
+                data, percent_line = self.strip_non_clause_lines(data, header)
+                ended = ended or percent_line
+                token_chunks.append(self.parse_tokens(data))
+        return self.build_cnf(header, np.concatenate(token_chunks))
+    def strip_non_clause_lines(self, data, header):
+        # Returns the clause lines of data, and whether a "%" line ended the clauses
+        start = 0
+        # Leading comment and problem lines are skipped without scanning the rest line by line
+        while start < len(data):
+            end = data.find(b"\n", start) + 1 or len(data)
+            line = data[start:end].strip()
+            if line and not self.parse_non_clause_line(line, header):
+                break
+            start = end
+        data = data[start:]
+        if b"c" not in data and b"p" not in data and b"%" not in data:
+            return data, False
+        clause_lines = []
+        for line in data.split(b"\n"):
+            stripped = line.strip()
+            if stripped.startswith(b"%"):
+                return b"\n".join(clause_lines), True
+            if not self.parse_non_clause_line(stripped, header):
+                clause_lines.append(line)
+        return b"\n".join(clause_lines), False
+    def parse_non_clause_line(self, line, header):
+        # Reads the problem line into header, returns False for clause lines
+        if line.startswith(b"p"):
+            infos = line.split()
+            if len(infos) != 4 or infos[1] != b"cnf":
+                raise ValueError("Invalid problem line: {}".format(line.decode(errors="replace")))
+            header[0], header[1] = int(infos[2]), int(infos[3])
+            return True
+        return line.startswith(b"c")
+    def parse_tokens(self, data):
+        if not data.strip():
+            return np.empty(0, dtype=np.int32)
+        # Older numpy only warns when it stops at a token that is not an int
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            try:
+                return np.fromstring(data, dtype=np.int32, sep=" ")
+            except (ValueError, DeprecationWarning):
+                raise ValueError("Invalid DIMACS clause data")
+    def build_cnf(self, header, tokens):
+        terminators = np.flatnonzero(tokens == 0)
+        lits = tokens[tokens != 0]
+        # Clause ends in lits: each terminator before position p shifts it by one
+        ends = terminators - np.arange(len(terminators))
+        if len(lits) > (ends[-1] if len(ends) > 0 else 0):
+            ends = np.append(ends, len(lits))
+        offsets = np.concatenate(([0], ends)).astype(np.int64)
+        return CNF(header[0], header[1], lits=lits, offsets=offsets)
@@ -0,0 +1,71 @@
+from collections import Counter
+from residual_formula import ResidualFormula
+
+LOOKAHEAD_HEURISTICS = ("up", "gup", "sup")
+
+class Lookahead(object):
+    """Failed-literal lookahead on the solver's own propagation.
+
+    The solver's probe_lit(lit) assigns lit on top of the current trail, unit propagates,
+    undoes everything through the trail and returns (number of implied literals, conflict).
+    A var scores the implied literals of both of its polarities. A literal whose propagation
+    conflicts is failed: the ranking stops there and the var gets the opposite value through
+    forced_value. Probe results are cached until the solver's trail changes.
+
+    With a budget, only the budget vars with the highest Jeroslow-Wang score on the residual
+    formula are probed.
+    """
+    def __init__(self, solver, budget=0):
+        self.solver = solver
+        self.budget = budget
+        self.cache = {}
+        self.cached_trail = []
+        self.forced_values = {}
+        self.num_probes = 0
+        self.num_cache_hits = 0
+        self.num_failed_lits = 0
+    def sync(self):
+        trail_lits = self.solver.get_trail_lits()
+        if trail_lits != self.cached_trail:
+            self.cache = {}
+            self.cached_trail = list(trail_lits)
+            self.forced_values = {}
+    def probe(self, lit):
+        if lit in self.cache:
+            self.num_cache_hits += 1
+            return self.cache[lit]
+        self.num_probes += 1
+        result = self.solver.probe_lit(lit)
+        self.cache[lit] = result
+        return result
+    def select_candidates(self, formula, vars):
+        if self.budget <= 0 or len(vars) <= self.budget:
+            return vars
+        scores = Counter()
+        if isinstance(formula, ResidualFormula):
+            for var in vars:
+                scores[var] = sum(2.0 ** -size for size in formula.involved_sizes(var)) + \
+                              sum(2.0 ** -size for size in formula.involved_sizes(-var))
+        else:
+            for clause in formula:
+                for lit in clause:
+                    scores[abs(lit)] += 2.0 ** -len(clause)
+        vars = set(vars)
+        return [var for var, _ in scores.most_common() if var in vars][:self.budget]
+    def rank_vars(self, formula, vars, k=1):
+        self.sync()
+        var_up_map = Counter()
+        for var in self.select_candidates(formula, vars):
+            for lit in (var, -var):
+                num_implied, conflict = self.probe(lit)
+                if conflict:
+                    self.num_failed_lits += 1
+                    self.forced_values[var] = 0 if lit > 0 else 1
+                    return [var]
+                var_up_map[var] += num_implied
+        return [s[0] for s in var_up_map.most_common(k)]
+    def forced_value(self, var):
+        # The value opposite to a failed literal of var, -1 if none was found
+        if self.solver.get_trail_lits() != self.cached_trail:
+            return -1
+        return self.forced_values.get(var, -1)
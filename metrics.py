@@ -1,13 +1,117 @@
 class Metrics(object):
-    def __init__(self, sat, exec_time, pick_branching_num, check_clause_status_time):
+    def __init__(self, sat, exec_time, pick_branching_num, num_restarts=0, restart_intervals=None,
+                 num_learnt_clauses=0, max_learnt_clauses=0, num_deleted_clauses=0, num_reductions=0,
+                 peak_clause_db_bytes=0, peak_memory=0, num_exported_clauses=0, num_imported_clauses=0,
+                 num_useful_imports=0, num_inprocessings=0, num_root_satisfied_clauses=0, num_root_false_lits=0,
+                 num_vivified_clauses=0, num_vivified_lits=0, inprocess_time=0.0, num_failed_lits=0, num_equivalent_vars=0,
+                 probe_time=0.0, num_conflicts=0, num_propagations=0,
+                 num_learnt_total=0, num_learnt_lits=0, sum_backjump_distance=0, max_backjump_distance=0,
+                 parse_time=0.0, init_time=0.0, propagate_time=0.0, analyze_time=0.0, decide_time=0.0,
+                 inference_time=0.0):
         self.sat = sat
         self.exec_time = exec_time
         self.pick_branching_num = pick_branching_num
-        self.check_clause_status_time = check_clause_status_time
+        self.num_restarts = num_restarts
+        self.restart_intervals = restart_intervals if restart_intervals is not None else []
+        self.num_learnt_clauses = num_learnt_clauses
+        self.max_learnt_clauses = max_learnt_clauses
+        self.num_deleted_clauses = num_deleted_clauses
+        self.num_reductions = num_reductions
+        self.peak_clause_db_bytes = peak_clause_db_bytes
+        # ru_maxrss of the solving process, in KB
+        self.peak_memory = peak_memory
+        # Clause sharing between portfolio members, num_useful_imports counts the imported
+        # clauses used in conflict analysis
+        self.num_exported_clauses = num_exported_clauses
+        self.num_imported_clauses = num_imported_clauses
+        self.num_useful_imports = num_useful_imports
+        # Root-level inprocessing: clauses deleted as true at level 0, lits stripped as false
+        # at level 0, learnt clauses/lits removed by vivification, failed lits found by probing and
+        # vars substituted by an equivalent lit. probe_time is not part of inprocess_time.
+        self.num_inprocessings = num_inprocessings
+        self.num_root_satisfied_clauses = num_root_satisfied_clauses
+        self.num_root_false_lits = num_root_false_lits
+        self.num_vivified_clauses = num_vivified_clauses
+        self.num_vivified_lits = num_vivified_lits
+        self.inprocess_time = inprocess_time
+        self.num_failed_lits = num_failed_lits
+        self.num_equivalent_vars = num_equivalent_vars
+        self.probe_time = probe_time
+        # Search counters, num_learnt_total counts every clause learnt, deleted or not
+        self.num_conflicts = num_conflicts
+        self.num_propagations = num_propagations
+        self.num_learnt_total = num_learnt_total
+        self.num_learnt_lits = num_learnt_lits
+        self.sum_backjump_distance = sum_backjump_distance
+        self.max_backjump_distance = max_backjump_distance
+        # Phase times in seconds, decide_time includes inference_time
+        self.parse_time = parse_time
+        self.init_time = init_time
+        self.propagate_time = propagate_time
+        self.analyze_time = analyze_time
+        self.decide_time = decide_time
+        self.inference_time = inference_time
+    def avg_restart_interval(self):
+        if len(self.restart_intervals) == 0:
+            return 0.0
+        return sum(self.restart_intervals) / float(len(self.restart_intervals))
+    def avg_backjump_distance(self):
+        if self.num_conflicts == 0:
+            return 0.0
+        return self.sum_backjump_distance / float(self.num_conflicts)
+    def avg_learnt_clause_size(self):
+        if self.num_learnt_total == 0:
+            return 0.0
+        return self.num_learnt_lits / float(self.num_learnt_total)
+    def propagations_per_sec(self):
+        return self.num_propagations / self.exec_time if self.exec_time > 0 else 0.0
+    def conflicts_per_sec(self):
+        return self.num_conflicts / self.exec_time if self.exec_time > 0 else 0.0
+    def to_record(self):
+        # Flat scalar fields for JSON/CSV export, restart_intervals reduced to its average
+        record = next(iter(self))
+        record = dict((key, value) for key, value in record if key != 'restart_intervals')
+        record['avg_restart_interval'] = self.avg_restart_interval()
+        record['avg_backjump_distance'] = self.avg_backjump_distance()
+        record['avg_learnt_clause_size'] = self.avg_learnt_clause_size()
+        record['propagations_per_sec'] = self.propagations_per_sec()
+        record['conflicts_per_sec'] = self.conflicts_per_sec()
+        return record
     def __iter__(self):
         yield {
             'sat': self.sat,
             'exec_time': self.exec_time,
             'pick_branching_num': self.pick_branching_num,
-            'check_clause_status_time': self.check_clause_status_time
+            'num_restarts': self.num_restarts,
+            'restart_intervals': self.restart_intervals,
+            'num_learnt_clauses': self.num_learnt_clauses,
+            'max_learnt_clauses': self.max_learnt_clauses,
+            'num_deleted_clauses': self.num_deleted_clauses,
+            'num_reductions': self.num_reductions,
+            'peak_clause_db_bytes': self.peak_clause_db_bytes,
+            'peak_memory': self.peak_memory,
+            'num_exported_clauses': self.num_exported_clauses,
+            'num_imported_clauses': self.num_imported_clauses,
+            'num_useful_imports': self.num_useful_imports,
+            'num_inprocessings': self.num_inprocessings,
+            'num_root_satisfied_clauses': self.num_root_satisfied_clauses,
+            'num_root_false_lits': self.num_root_false_lits,
+            'num_vivified_clauses': self.num_vivified_clauses,
+            'num_vivified_lits': self.num_vivified_lits,
+            'inprocess_time': self.inprocess_time,
+            'num_failed_lits': self.num_failed_lits,
+            'num_equivalent_vars': self.num_equivalent_vars,
+            'probe_time': self.probe_time,
+            'num_conflicts': self.num_conflicts,
+            'num_propagations': self.num_propagations,
+            'num_learnt_total': self.num_learnt_total,
+            'num_learnt_lits': self.num_learnt_lits,
+            'sum_backjump_distance': self.sum_backjump_distance,
+            'max_backjump_distance': self.max_backjump_distance,
+            'parse_time': self.parse_time,
+            'init_time': self.init_time,
+            'propagate_time': self.propagate_time,
+            'analyze_time': self.analyze_time,
+            'decide_time': self.decide_time,
+            'inference_time': self.inference_time
         }.items()
\ No newline at end of file
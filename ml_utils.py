@@ -1,12 +1,22 @@
 import numpy as np
+from residual_formula import ResidualFormula
 
 def build_features(formula, var):
+    if isinstance(formula, ResidualFormula):
+        return build_residual_features(formula, var)
     # Ratio of pos/neg lit
     pos_neg_ratio = get_pos_neg_ratio(formula, var)
     mean_pos_lit, var_pos_lit = get_lit_clause_num_stats(formula, var)
     mean_neg_lit, var_neg_lit = get_lit_clause_num_stats(formula, -var)
     return np.array([pos_neg_ratio, mean_pos_lit, var_pos_lit, mean_neg_lit, var_neg_lit]).reshape(1, -1)
 
+def build_residual_features(residual_formula, var):
+    # Same features read off the open clauses' unassigned sizes, without building the clauses
+    pos_sizes = [size - 1 for size in residual_formula.involved_sizes(var)]
+    neg_sizes = [size - 1 for size in residual_formula.involved_sizes(-var)]
+    pos_neg_ratio = float(len(pos_sizes))/len(neg_sizes) if neg_sizes else float(len(pos_sizes))
+    return np.array([pos_neg_ratio, np.mean(pos_sizes), np.var(pos_sizes), np.mean(neg_sizes), np.var(neg_sizes)]).reshape(1, -1)
+
 def get_lit_clause_num_stats(formula, lit):
     num_other_lits = [len(clause)-1 for clause in formula if lit in clause]
     return np.mean(num_other_lits), np.var(num_other_lits)
@@ -18,4 +28,4 @@ def get_pos_neg_ratio(formula, var):
             pos_num += 1
         elif -var in clause:
             neg_num += 1
-    return float(pos_num)/neg_num
\ No newline at end of file
+    return float(pos_num)/neg_num if neg_num > 0 else float(pos_num)
@@ -0,0 +1,386 @@
+import logging
+import time
+
+def equivalent_lit_components(graph):
+    # Iterative Tarjan, returns the strongly connected components of more than one lit
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph.get(successor, ()))))
+                    break
+                if successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        lit = stack.pop()
+                        on_stack.discard(lit)
+                        component.append(lit)
+                        if lit == node:
+                            break
+                    if len(component) > 1:
+                        components.append(component)
+    return components
+
+class Preprocessor(object):
+    """SatELite-style simplification of a formula before solving.
+
+    Duplicate and tautological clauses are dropped, units are propagated, then clauses are
+    subsumed and strengthened (self-subsuming resolution) with occurrence lists, and vars are
+    eliminated by resolution when that adds at most elim_grow clauses. Vars occurring in more
+    than max_occurrences clauses are not eliminated, nor are they for a resolvent longer than
+    max_resolvent_size. Var ids are kept, so the simplified formula is solved with the same
+    atomic props.
+
+    With probing, each round also substitutes the lits of every strongly connected component
+    of the binary implication graph by one of them, and probes both lits of the vars in binary
+    clauses by unit propagation: a failed lit's negation and the lits both polarities imply
+    are units, and a long clause made unit by a probe gives a hyper-binary resolvent. Probing
+    stops after probe_budget clause visits, at most max_hyper_binaries resolvents are added.
+
+    Removed units and eliminated vars' clauses are pushed on an elimination stack as
+    (witness lit, clause) pairs. extend_model walks it backwards, making the witness true
+    whenever its clause is not satisfied yet, which extends any model of the simplified
+    formula to the original one.
+    """
+    def __init__(self, formula, num_vars, elim_grow=0, max_occurrences=16, max_resolvent_size=20, probing=True,
+                 probe_budget=200000, max_hyper_binaries=1000):
+        self.formula = formula
+        self.num_vars = num_vars
+        self.elim_grow = elim_grow
+        self.max_occurrences = max_occurrences
+        self.max_resolvent_size = max_resolvent_size
+        self.probing = probing
+        self.probe_budget = probe_budget
+        self.max_hyper_binaries = max_hyper_binaries
+        self.clauses = []
+        self.clause_keys = set()
+        self.occurs = {}
+        self.units = []
+        self.subsumption_queue = []
+        self.elimination_stack = []
+        self.eliminated = set()
+        self.unsat = False
+        self.num_duplicates = 0
+        self.num_tautologies = 0
+        self.num_units = 0
+        self.num_subsumed = 0
+        self.num_strengthened = 0
+        self.num_eliminated_vars = 0
+        self.num_equivalent_vars = 0
+        self.num_probes = 0
+        self.num_failed_lits = 0
+        self.num_necessary_lits = 0
+        self.num_hyper_binaries = 0
+        self.preprocess_time = 0.0
+    def preprocess(self):
+        # Returns the simplified formula, which holds an empty clause if it is UNSAT
+        start_time = time.perf_counter()
+        for clause in self.formula:
+            self.add_clause(clause)
+        self.simplify()
+        changed = True
+        while changed and not self.unsat:
+            changed = False
+            if self.probing:
+                changed = self.substitute_equivalences() | self.probe_lits()
+            for var in self.elimination_candidates():
+                if self.unsat:
+                    break
+                if self.eliminate_var(var):
+                    changed = True
+                    self.simplify()
+        self.preprocess_time = time.perf_counter() - start_time
+        logging.debug(self.report())
+        return self.get_formula()
+    def get_formula(self):
+        if self.unsat:
+            return [[]]
+        return [clause for clause in self.clauses if clause is not None]
+    def add_clause(self, clause):
+        clause = list(dict.fromkeys(clause))
+        key = frozenset(clause)
+        if any(-lit in key for lit in clause):
+            self.num_tautologies += 1
+            return
+        if key in self.clause_keys:
+            self.num_duplicates += 1
+            return
+        clause_id = len(self.clauses)
+        self.clauses.append(clause)
+        self.clause_keys.add(key)
+        for lit in clause:
+            self.occurs.setdefault(lit, set()).add(clause_id)
+        self.on_clause_changed(clause_id)
+    def remove_clause(self, clause_id):
+        clause = self.clauses[clause_id]
+        self.clauses[clause_id] = None
+        self.clause_keys.discard(frozenset(clause))
+        for lit in clause:
+            self.occurs[lit].discard(clause_id)
+    def strengthen_clause(self, clause_id, lit):
+        clause = self.clauses[clause_id]
+        self.clause_keys.discard(frozenset(clause))
+        clause.remove(lit)
+        self.occurs[lit].discard(clause_id)
+        key = frozenset(clause)
+        if key in self.clause_keys:
+            self.remove_clause_lits(clause_id)
+            self.num_duplicates += 1
+            return
+        self.clause_keys.add(key)
+        self.on_clause_changed(clause_id)
+    def remove_clause_lits(self, clause_id):
+        # For a clause that is already out of clause_keys
+        for lit in self.clauses[clause_id]:
+            self.occurs[lit].discard(clause_id)
+        self.clauses[clause_id] = None
+    def on_clause_changed(self, clause_id):
+        clause = self.clauses[clause_id]
+        if len(clause) == 0:
+            self.unsat = True
+        elif len(clause) == 1:
+            self.units.append(clause[0])
+        self.subsumption_queue.append(clause_id)
+    def simplify(self):
+        # Unit propagation and subsumption until neither changes the formula
+        while (self.units or self.subsumption_queue) and not self.unsat:
+            if self.units:
+                self.propagate_unit(self.units.pop())
+                continue
+            clause_id = self.subsumption_queue.pop()
+            if self.clauses[clause_id] is not None:
+                self.backward_subsume(clause_id)
+    def propagate_unit(self, lit):
+        if abs(lit) in self.eliminated:
+            return
+        if not self.occurs.get(lit) and not self.occurs.get(-lit):
+            return
+        self.elimination_stack.append((lit, [lit]))
+        self.eliminated.add(abs(lit))
+        self.num_units += 1
+        for clause_id in list(self.occurs.get(lit, ())):
+            self.remove_clause(clause_id)
+        for clause_id in list(self.occurs.get(-lit, ())):
+            self.strengthen_clause(clause_id, -lit)
+    def backward_subsume(self, clause_id):
+        # Removes the clauses clause subsumes and strengthens the ones it resolves with on one lit
+        clause = self.clauses[clause_id]
+        clause_lits = set(clause)
+        var = min((abs(lit) for lit in clause), key=lambda var: len(self.occurs.get(var, ())) + len(self.occurs.get(-var, ())))
+        candidate_ids = self.occurs.get(var, set()) | self.occurs.get(-var, set())
+        for other_id in candidate_ids:
+            other_clause = self.clauses[other_id]
+            if other_id == clause_id or other_clause is None or len(other_clause) < len(clause):
+                continue
+            num_common, flipped_lit = 0, 0
+            for lit in other_clause:
+                if lit in clause_lits:
+                    num_common += 1
+                elif -lit in clause_lits:
+                    if flipped_lit != 0:
+                        break
+                    flipped_lit = lit
+            else:
+                if flipped_lit == 0 and num_common == len(clause):
+                    self.remove_clause(other_id)
+                    self.num_subsumed += 1
+                elif flipped_lit != 0 and num_common == len(clause) - 1:
+                    self.strengthen_clause(other_id, flipped_lit)
+                    self.num_strengthened += 1
+                    if self.unsat:
+                        return
+                if self.clauses[clause_id] is None:
+                    return
+    def implication_graph(self):
+        # Binary clause (a, b) gives the edges -a -> b and -b -> a
+        graph = {}
+        for clause in self.clauses:
+            if clause is not None and len(clause) == 2:
+                graph.setdefault(-clause[0], []).append(clause[1])
+                graph.setdefault(-clause[1], []).append(clause[0])
+        return graph
+    def substitute_equivalences(self):
+        # Returns True if any var was substituted
+        substitutes = {}
+        for component in equivalent_lit_components(self.implication_graph()):
+            if any(-lit in component for lit in component):
+                self.unsat = True
+                return True
+            representative = min(component, key=abs)
+            # Every component has a mirror one with the negated lits, only one of them is used
+            if representative < 0:
+                continue
+            for lit in component:
+                if lit != representative:
+                    substitutes[lit] = representative
+                    substitutes[-lit] = -representative
+        for lit, representative in substitutes.items():
+            if lit < 0:
+                continue
+            # lit takes the representative's value when the model is extended
+            self.elimination_stack.append((lit, [lit, -representative]))
+            self.elimination_stack.append((-lit, [-lit, representative]))
+            self.eliminated.add(lit)
+            self.num_equivalent_vars += 1
+            for clause_id in list(self.occurs.get(lit, ())) + list(self.occurs.get(-lit, ())):
+                clause = self.clauses[clause_id]
+                self.remove_clause(clause_id)
+                self.add_clause([substitutes.get(clause_lit, clause_lit) for clause_lit in clause])
+        self.simplify()
+        return len(substitutes) > 0
+    def probe(self, lit, hyper_binaries):
+        # Unit propagates lit, returns the implied lits, lit included, or None on a conflict.
+        # Long clauses made unit are added to hyper_binaries as (-lit, implied lit).
+        implied = [lit]
+        true_lits = set(implied)
+        head = 0
+        while head < len(implied):
+            false_lit = -implied[head]
+            head += 1
+            for clause_id in self.occurs.get(false_lit, ()):
+                clause = self.clauses[clause_id]
+                self.probe_budget -= 1
+                unassigned_lit, num_unassigned = 0, 0
+                for clause_lit in clause:
+                    if clause_lit in true_lits:
+                        break
+                    if -clause_lit not in true_lits:
+                        unassigned_lit = clause_lit
+                        num_unassigned += 1
+                        if num_unassigned > 1:
+                            break
+                else:
+                    if num_unassigned == 0:
+                        return None
+                    implied.append(unassigned_lit)
+                    true_lits.add(unassigned_lit)
+                    if len(clause) > 2:
+                        hyper_binaries.append([-lit, unassigned_lit])
+        return implied
+    def probe_lits(self):
+        # Returns True if the formula changed
+        graph = self.implication_graph()
+        candidates = sorted(set(abs(lit) for lit in graph), key=lambda var: -len(graph.get(var, ())) - len(graph.get(-var, ())))
+        units, hyper_binaries = [], []
+        for var in candidates:
+            if self.probe_budget <= 0:
+                break
+            if var in self.eliminated:
+                continue
+            self.num_probes += 1
+            pos_hyper_binaries, neg_hyper_binaries = [], []
+            pos_implied = self.probe(var, pos_hyper_binaries)
+            neg_implied = self.probe(-var, neg_hyper_binaries)
+            if pos_implied is None or neg_implied is None:
+                if pos_implied is None and neg_implied is None:
+                    self.unsat = True
+                    return True
+                self.num_failed_lits += 1
+                units.append(-var if pos_implied is None else var)
+                continue
+            necessary_lits = set(pos_implied) & set(neg_implied)
+            self.num_necessary_lits += len(necessary_lits)
+            units.extend(necessary_lits)
+            hyper_binaries.extend(pos_hyper_binaries + neg_hyper_binaries)
+        # Probes don't see each other's units, which are all implied by the formula anyway
+        for unit in units:
+            self.add_clause([unit])
+        num_hyper_binaries = self.num_hyper_binaries
+        for clause in hyper_binaries:
+            if self.num_hyper_binaries >= self.max_hyper_binaries:
+                break
+            if frozenset(clause) not in self.clause_keys:
+                self.add_clause(clause)
+                self.num_hyper_binaries += 1
+        self.simplify()
+        return len(units) > 0 or self.num_hyper_binaries > num_hyper_binaries
+    def elimination_candidates(self):
+        # Vars still in the formula, cheapest elimination first
+        vars = set(abs(lit) for lit, clause_ids in self.occurs.items() if clause_ids) - self.eliminated
+        return sorted(vars, key=lambda var: len(self.occurs.get(var, ())) * len(self.occurs.get(-var, ())))
+    def resolvents(self, var, pos_ids, neg_ids, max_resolvents):
+        # Non tautological resolvents on var, None once there are more than max_resolvents
+        resolvents = []
+        for pos_id in pos_ids:
+            pos_lits = [lit for lit in self.clauses[pos_id] if lit != var]
+            pos_set = set(pos_lits)
+            for neg_id in neg_ids:
+                resolvent = list(pos_lits)
+                for lit in self.clauses[neg_id]:
+                    if lit == -var or lit in pos_set:
+                        continue
+                    if -lit in pos_set:
+                        break
+                    resolvent.append(lit)
+                else:
+                    if len(resolvent) > self.max_resolvent_size:
+                        return None
+                    resolvents.append(resolvent)
+                    if len(resolvents) > max_resolvents:
+                        return None
+        return resolvents
+    def eliminate_var(self, var):
+        if var in self.eliminated:
+            return False
+        pos_ids, neg_ids = list(self.occurs.get(var, ())), list(self.occurs.get(-var, ()))
+        num_clauses = len(pos_ids) + len(neg_ids)
+        if num_clauses == 0 or (pos_ids and neg_ids and num_clauses > self.max_occurrences):
+            return False
+        resolvents = self.resolvents(var, pos_ids, neg_ids, num_clauses + self.elim_grow)
+        if resolvents is None:
+            return False
+        # The smaller side is saved with var as witness, var defaulting to the other value
+        saved_ids, witness = (pos_ids, var) if len(pos_ids) <= len(neg_ids) else (neg_ids, -var)
+        for clause_id in saved_ids:
+            self.elimination_stack.append((witness, list(self.clauses[clause_id])))
+        self.elimination_stack.append((-witness, [-witness]))
+        self.eliminated.add(var)
+        self.num_eliminated_vars += 1
+        for clause_id in pos_ids + neg_ids:
+            self.remove_clause(clause_id)
+        for resolvent in resolvents:
+            self.add_clause(resolvent)
+        return True
+    def extend_model(self, model):
+        # model maps vars of the simplified formula to 0/1, the result maps every var. Vars the
+        # model leaves unassigned are set to 0 first, removed ones are set by the stack.
+        model = dict(model)
+        for var in self.eliminated:
+            model.pop(var, None)
+        for var in range(1, self.num_vars+1):
+            if var not in model and var not in self.eliminated:
+                model[var] = 0
+        for witness, clause in reversed(self.elimination_stack):
+            if not any(model.get(abs(lit), -1) == (1 if lit > 0 else 0) for lit in clause):
+                model[abs(witness)] = 1 if witness > 0 else 0
+        return model
+    def count_vars(self, formula):
+        return len(set(abs(lit) for clause in formula for lit in clause))
+    def report(self):
+        formula = self.get_formula()
+        return "Preprocessing: {} vars, {} clauses -> {} vars, {} clauses in {:.3f}s ({} eliminated vars, {} equivalent vars, " \
+               "{} units, {} failed lits, {} necessary lits, {} hyper-binary resolvents, {} subsumed, {} strengthened, " \
+               "{} duplicates, {} tautologies){}".format(
+                   self.count_vars(self.formula), len(self.formula), self.count_vars(formula), len(formula),
+                   self.preprocess_time, self.num_eliminated_vars, self.num_equivalent_vars, self.num_units,
+                   self.num_failed_lits, self.num_necessary_lits, self.num_hyper_binaries, self.num_subsumed,
+                   self.num_strengthened, self.num_duplicates, self.num_tautologies, ", UNSAT" if self.unsat else "")
@@ -0,0 +1,158 @@
+import collections
+import cProfile
+import os
+import pstats
+import signal
+import sys
+
+PROFILERS = ("cprofile", "sampling")
+PROFILE_EXTENSIONS = {"cprofile": ".prof", "sampling": ".collapsed"}
+
+def format_function(function):
+    # pstats key (file, line, name) as "module.py:name", builtins keep their own name
+    file_name, line, name = function
+    if file_name == "~":
+        return name
+    return "{}:{}".format(os.path.basename(file_name), name)
+
+def format_frame(frame):
+    code = frame.f_code
+    return "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+
+class SolverProfiler(object):
+    """Profiles the code run between start and stop.
+
+    cprofile traces every call with cProfile, so call counts and self/cumulative times are
+    exact but the run is a few times slower. sampling records the interpreter's stack every
+    interval seconds of CPU time from a SIGPROF handler, which costs little but only sees
+    functions running often enough, and keeps whole stacks as "f1;f2;f3" keys.
+    """
+    def __init__(self, profiler="cprofile", interval=0.001):
+        if profiler not in PROFILERS:
+            raise ValueError("Unknown profiler: {}".format(profiler))
+        self.profiler = profiler
+        self.interval = interval
+        self.profile = None
+        self.start_frame = None
+        self.stack_counts = collections.Counter()
+    def start(self):
+        if self.profiler == "cprofile":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            # Stacks are cut at the caller of start, as cProfile only sees the calls made after it
+            self.start_frame = sys._getframe(1)
+            signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+    def stop(self):
+        if self.profiler == "cprofile":
+            self.profile.disable()
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None and frame is not self.start_frame:
+            stack.append(format_frame(frame))
+            frame = frame.f_back
+        self.stack_counts[";".join(reversed(stack))] += 1
+    def save(self, path):
+        if self.profiler == "cprofile":
+            self.profile.dump_stats(path)
+        else:
+            write_collapsed(path, self.stack_counts)
+
+def write_collapsed(path, stack_counts):
+    # One "f1;f2;f3 count" line per stack, the input format of flamegraph.pl and speedscope
+    with open(path, "w") as f:
+        for stack, count in sorted(stack_counts.items()):
+            if count > 0:
+                f.write("{} {}\n".format(stack, count))
+
+def read_collapsed(path, stack_counts):
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stack_counts[stack] += int(count)
+
+def collapse_stats(stats, min_fraction=1e-4):
+    # Rebuilds stacks from the caller graph of stats, in microseconds of self time. A function
+    # called from several callers has its time split between them by their share of its
+    # cumulative time, so the stacks are estimates. Recursive calls end the stack, and paths
+    # carrying less than min_fraction of the total time are dropped.
+    callees = collections.defaultdict(list)
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, caller_stats in callers.items():
+            if caller != function:
+                callees[caller].append((function, caller_stats[3]))
+    total_time = sum(function_stats[2] for function_stats in stats.stats.values())
+    stack_counts = collections.Counter()
+    roots = [function for function, function_stats in stats.stats.items()
+             if not any(caller != function for caller in function_stats[4])]
+    # Each entry is a function, its stack and the share of its cumulative time spent on this stack
+    pending = [(root, [format_function(root)], 1.0) for root in roots]
+    while pending:
+        function, stack, fraction = pending.pop()
+        _, _, self_time, cumulative_time, _ = stats.stats[function]
+        stack_counts[";".join(stack)] += int(round(fraction * self_time * 1e6))
+        for callee, callee_time in callees[function]:
+            callee_name = format_function(callee)
+            callee_cumulative_time = stats.stats[callee][3]
+            if callee_name in stack or callee_cumulative_time <= 0:
+                continue
+            callee_fraction = fraction * min(callee_time / callee_cumulative_time, 1.0)
+            if callee_fraction * callee_cumulative_time < min_fraction * total_time:
+                continue
+            pending.append((callee, stack + [callee_name], callee_fraction))
+    return stack_counts
+
+def function_times_from_stats(stats):
+    # {function: [self seconds, cumulative seconds, calls]}
+    return dict((format_function(function), [self_time, cumulative_time, num_calls])
+                for function, (_, num_calls, self_time, cumulative_time, _) in stats.stats.items())
+
+def function_times_from_stacks(stack_counts, interval):
+    # Self time of a function is its share of the samples as the innermost frame, cumulative
+    # time its share of the samples with it anywhere on the stack. Calls are unknown.
+    function_times = {}
+    for stack, count in stack_counts.items():
+        frames = stack.split(";")
+        for frame in set(frames):
+            function_times.setdefault(frame, [0.0, 0.0, None])[1] += count * interval
+        function_times[frames[-1]][0] += count * interval
+    return function_times
+
+def format_report(function_times, total_time, num_instances, top=20):
+    lines = ["Profile of {} instance(s), {:.3f}s".format(num_instances, total_time)]
+    for title, index in (("cumulative", 1), ("self", 0)):
+        lines.append("Top functions by {} time:".format(title))
+        lines.append("  {:>10} {:>6} {:>10} {:>6} {:>10}  {}".format("self(s)", "%", "cum(s)", "%", "calls", "function"))
+        ranked = sorted(function_times.items(), key=lambda item: item[1][index], reverse=True)
+        for function, (self_time, cumulative_time, num_calls) in ranked[:top]:
+            lines.append("  {:>10.3f} {:>6.1f} {:>10.3f} {:>6.1f} {:>10}  {}".format(
+                self_time, 100.0 * self_time / total_time if total_time > 0 else 0.0,
+                cumulative_time, 100.0 * cumulative_time / total_time if total_time > 0 else 0.0,
+                num_calls if num_calls is not None else "-", function))
+    return "\n".join(lines)
+
+def aggregate_profiles(profile_paths, profiler="cprofile", interval=0.001, top=20):
+    # Merges the per-instance profiles into collapsed stacks and a text report of the top functions,
+    # skipping the instances without a profile file (timed out or failed)
+    profile_paths = [path for path in profile_paths if os.path.exists(path)]
+    if not profile_paths:
+        return None, None
+    if profiler == "cprofile":
+        stats = pstats.Stats(profile_paths[0])
+        for path in profile_paths[1:]:
+            stats.add(path)
+        function_times = function_times_from_stats(stats)
+        stack_counts = collapse_stats(stats)
+        total_time = stats.total_tt
+    else:
+        stack_counts = collections.Counter()
+        for path in profile_paths:
+            read_collapsed(path, stack_counts)
+        function_times = function_times_from_stacks(stack_counts, interval)
+        total_time = sum(stack_counts.values()) * interval
+    return stack_counts, format_report(function_times, total_time, len(profile_paths), top)
@@ -0,0 +1,132 @@
+class ResidualFormula(object):
+    """Live view of the formula shortened by the current assignment.
+
+    A clause is open while none of its literals is true. open_clause_ids holds the ids of the
+    open clauses and size_clause_ids[u] those with u unassigned literals, num_unassigned
+    being kept for every clause. Assignments are applied lazily: sync() replays the solver's
+    trail from the last position both have in common, undoing what the solver backtracked
+    over, so only clauses that got satisfied, reopened or shrunk are touched.
+
+    Iterating yields the residual clauses one at a time, which is enough for the heuristics
+    and ml_utils.build_features that take a formula.
+    """
+    def __init__(self, num_vars, clauses=()):
+        self.num_vars = 0
+        self.values = [-1]
+        self.lit_clauses = {}
+        self.clauses = []
+        self.num_true = []
+        self.num_unassigned = []
+        self.open_clause_ids = set()
+        self.size_clause_ids = {}
+        self.applied = []
+        self.limit = 0
+        self.grow(num_vars)
+        for clause in clauses:
+            self.add_clause(clause)
+    def grow(self, num_vars):
+        if num_vars <= self.num_vars:
+            return
+        num_new_vars = num_vars - self.num_vars
+        self.values = [-1] + self.values[1:self.num_vars+1] + [-1] * (2 * num_new_vars) + self.values[self.num_vars+1:]
+        for var in range(self.num_vars + 1, num_vars + 1):
+            self.lit_clauses[var] = []
+            self.lit_clauses[-var] = []
+        self.num_vars = num_vars
+    def add_clause(self, clause):
+        # The clause's state is computed against the assignment applied so far
+        clause = list(clause)
+        self.grow(max([abs(lit) for lit in clause] + [0]))
+        clause_id = len(self.clauses)
+        self.clauses.append(clause)
+        self.num_true.append(sum(1 for lit in clause if self.values[lit] == 1))
+        self.num_unassigned.append(sum(1 for lit in clause if self.values[lit] == -1))
+        for lit in clause:
+            self.lit_clauses[lit].append(clause_id)
+        if self.num_true[clause_id] == 0:
+            self.open_clause(clause_id, 1)
+        return clause_id
+    def open_clause(self, clause_id, sign):
+        # sign 1 opens the clause, -1 closes it
+        size = self.num_unassigned[clause_id]
+        if sign > 0:
+            self.open_clause_ids.add(clause_id)
+            self.size_clause_ids.setdefault(size, set()).add(clause_id)
+        else:
+            self.open_clause_ids.discard(clause_id)
+            self.size_clause_ids[size].discard(clause_id)
+    def resize_clause(self, clause_id, size):
+        # Moves an open clause from its current number of unassigned literals to size
+        self.size_clause_ids[self.num_unassigned[clause_id]].discard(clause_id)
+        self.size_clause_ids.setdefault(size, set()).add(clause_id)
+        self.num_unassigned[clause_id] = size
+    def assign(self, lit):
+        num_true, num_unassigned = self.num_true, self.num_unassigned
+        for clause_id in self.lit_clauses[lit]:
+            num_true[clause_id] += 1
+            if num_true[clause_id] == 1:
+                self.open_clause(clause_id, -1)
+            num_unassigned[clause_id] -= 1
+        for clause_id in self.lit_clauses[-lit]:
+            if num_true[clause_id] == 0:
+                self.resize_clause(clause_id, num_unassigned[clause_id] - 1)
+            else:
+                num_unassigned[clause_id] -= 1
+        self.values[lit] = 1
+        self.values[-lit] = 0
+        self.applied.append(lit)
+    def unassign(self, lit):
+        num_true, num_unassigned = self.num_true, self.num_unassigned
+        for clause_id in self.lit_clauses[-lit]:
+            if num_true[clause_id] == 0:
+                self.resize_clause(clause_id, num_unassigned[clause_id] + 1)
+            else:
+                num_unassigned[clause_id] += 1
+        for clause_id in self.lit_clauses[lit]:
+            num_unassigned[clause_id] += 1
+            num_true[clause_id] -= 1
+            if num_true[clause_id] == 0:
+                self.open_clause(clause_id, 1)
+        self.values[lit] = -1
+        self.values[-lit] = -1
+    def cancel(self, trail_size):
+        # The solver's trail was cut back to trail_size since the last sync
+        if trail_size < self.limit:
+            self.limit = trail_size
+    def sync(self, trail_lits):
+        applied = self.applied
+        while len(applied) > self.limit:
+            self.unassign(applied.pop())
+        for i in range(len(applied), len(trail_lits)):
+            self.assign(trail_lits[i])
+        self.limit = len(applied)
+        return self
+    def clause_lits(self, clause_id):
+        values = self.values
+        for lit in self.clauses[clause_id]:
+            if values[lit] == -1:
+                yield lit
+    def residual_clause(self, clause_id):
+        values = self.values
+        return [lit for lit in self.clauses[clause_id] if values[lit] == -1]
+    def min_size(self):
+        sizes = [size for size, clause_ids in self.size_clause_ids.items() if clause_ids]
+        return min(sizes) if sizes else -1
+    def shortest_clauses(self):
+        min_size = self.min_size()
+        return [self.residual_clause(clause_id) for clause_id in self.size_clause_ids.get(min_size, ())]
+    def involved_sizes(self, lit):
+        num_true, num_unassigned = self.num_true, self.num_unassigned
+        for clause_id in self.lit_clauses.get(lit, ()):
+            if num_true[clause_id] == 0:
+                yield num_unassigned[clause_id]
+    def involved_clauses(self, var):
+        for lit in (var, -var):
+            for clause_id in self.lit_clauses.get(lit, ()):
+                if self.num_true[clause_id] == 0:
+                    yield self.residual_clause(clause_id)
+    def __iter__(self):
+        for clause_id in self.open_clause_ids:
+            yield self.residual_clause(clause_id)
+    def __len__(self):
+        return len(self.open_clause_ids)
@@ -0,0 +1,82 @@
+RESTART_POLICIES = ("none", "fixed", "luby", "geometric", "glucose")
+
+def luby(y, x):
+    # x-th element (0-based) of the Luby sequence scaled by powers of y: 1 1 2 1 1 2 4 ...
+    size, seq = 1, 0
+    while size < x + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != x:
+        size = (size - 1) >> 1
+        seq -= 1
+        x = x % size
+    return y ** seq
+
+class RestartPolicy(object):
+    def __init__(self, interval=100):
+        self.interval = interval
+        self.num_restarts = 0
+        self.num_conflicts = 0
+        self.restart_intervals = []
+    def on_conflict(self, lbd):
+        self.num_conflicts += 1
+    def should_restart(self):
+        return False
+    def on_restart(self):
+        self.num_restarts += 1
+        self.restart_intervals.append(self.num_conflicts)
+        self.num_conflicts = 0
+
+class FixedRestart(RestartPolicy):
+    def should_restart(self):
+        return self.num_conflicts >= self.interval
+
+class LubyRestart(RestartPolicy):
+    def should_restart(self):
+        return self.num_conflicts >= self.interval * luby(2, self.num_restarts)
+
+class GeometricRestart(RestartPolicy):
+    def __init__(self, interval=100, factor=1.5):
+        super(GeometricRestart, self).__init__(interval)
+        self.factor = factor
+        self.limit = float(interval)
+    def should_restart(self):
+        return self.num_conflicts >= self.limit
+    def on_restart(self):
+        super(GeometricRestart, self).on_restart()
+        self.limit *= self.factor
+
+class GlucoseRestart(RestartPolicy):
+    # Restart when the recent learnt clauses are clearly worse (higher LBD) than the
+    # long-run average: fast_lbd * margin > slow_lbd, after at least min_conflicts.
+    def __init__(self, interval=50, margin=0.8, fast_alpha=1.0/32, slow_alpha=1.0/4096):
+        super(GlucoseRestart, self).__init__(interval)
+        self.margin = margin
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.fast_lbd = 0.0
+        self.slow_lbd = 0.0
+        self.total_conflicts = 0
+    def on_conflict(self, lbd):
+        super(GlucoseRestart, self).on_conflict(lbd)
+        self.total_conflicts += 1
+        # Bias-corrected start: plain averages until the windows are filled
+        fast_alpha = max(self.fast_alpha, 1.0 / self.total_conflicts)
+        slow_alpha = max(self.slow_alpha, 1.0 / self.total_conflicts)
+        self.fast_lbd += fast_alpha * (lbd - self.fast_lbd)
+        self.slow_lbd += slow_alpha * (lbd - self.slow_lbd)
+    def should_restart(self):
+        return self.num_conflicts >= self.interval and self.fast_lbd * self.margin > self.slow_lbd
+
+def choose_restart_policy(restart_policy, restart_interval=100):
+    if restart_policy is None or restart_policy == "none":
+        return RestartPolicy(restart_interval)
+    if restart_policy == "fixed":
+        return FixedRestart(restart_interval)
+    if restart_policy == "luby":
+        return LubyRestart(restart_interval)
+    if restart_policy == "geometric":
+        return GeometricRestart(restart_interval)
+    if restart_policy == "glucose":
+        return GlucoseRestart()
+    raise ValueError("Unrecognised restart policy")
@@ -25,14 +25,15 @@ def add_arguments(parser):
     parser.add_argument("--input", type=str, default="inputs", help="SAT input")
     parser.add_argument("--output", type=str, default="dataset_output/", help="SAT output")
     parser.add_argument("--model_dir", type=str, default="model_dir/", help="Model directory")
+    parser.add_argument("--cnf_cache_dir", type=str, default="cnf_cache", help="Binary cache of parsed inputs, empty to disable")
 
 def run_sat_solver_single(configs, input_path):
-    sat_reader = SatReader()
+    sat_reader = SatReader(configs.cnf_cache_dir)
     cnf = sat_reader.read_input(input_path)
     solver_class = CDCL_WL
     solver = solver_class(cnf.formula, [x+1 for x in range(cnf.num_props)], branching_heuristic="jw")
     metric = solver.solve()
-    sat_assignments = solver.assignments
+    sat_assignments = dict(solver.assignments)
     return metric, cnf.formula, sat_assignments
 
 def extract_input_name(input_path):
@@ -1,10 +1,21 @@
 import argparse
+import csv
 
 import datetime
+import json
+import multiprocessing
+import multiprocessing.connection
+import resource
+import time
+from cnf import CNF
 from io_utils import SatReader, SatWriter
+from preprocessor import Preprocessor
+from profiler import SolverProfiler, PROFILE_EXTENSIONS, aggregate_profiles, write_collapsed
 from dpll import DPLL
 from cdcl import CDCL
 from cdcl_wl import CDCL_WL
+from cube_and_conquer import CubeAndConquer
+from clause_sharing import ClauseExchange, ClauseSharing
 # from cryptosat import CryptoSat
 import os
 
@@ -22,6 +33,38 @@ def add_arguments(parser):
     parser.add_argument("--experiment-name", type=str, default=None, help="Experiment's name")
     parser.add_argument("--model-dir", type=str, default="model_dir", help="Variable prediction model directory")
     parser.add_argument("--model-name", type=str, default=None, help="Variable prediction model name")
+    parser.add_argument("--restart-policy", type=str, default="none", help="CDCL restart policy: none|fixed|luby|geometric|glucose")
+    parser.add_argument("--restart-interval", type=int, default=100, help="Conflicts per restart unit for fixed|luby|geometric")
+    parser.add_argument("--reuse-trail", type="bool", default=False, help="Partial restarts keeping the reusable part of the trail")
+    parser.add_argument("--phase-saving", type="bool", default=True, help="Decide vars with their last assigned value")
+    parser.add_argument("--rephase", type=str, default="none", help="Reset saved phases at restarts: none|target|best")
+    parser.add_argument("--inprocess", type="bool", default=False, help="Simplify clauses by the lits of level 0 and vivify learnt clauses at level 0")
+    parser.add_argument("--inprocess-interval", type=int, default=1000, help="Conflicts between inprocessing steps")
+    parser.add_argument("--inprocess-budget", type=float, default=0.1, help="Largest share of the search time spent inprocessing")
+    parser.add_argument("--inprocess-probe-budget", type=float, default=0.05,
+                        help="Largest share of the search time spent probing failed lits and substituting equivalent lits when inprocessing")
+    parser.add_argument("--lookahead-budget", type=int, default=20, help="Vars probed per up|gup|sup decision, 0 probes every unassigned var")
+    parser.add_argument("--preprocess", type="bool", default=False, help="Simplify the formula (SatELite-style) before solving")
+    parser.add_argument("--probing", type="bool", default=True, help="With --preprocess, substitute equivalent lits and probe failed lits")
+    parser.add_argument("--cnf-cache-dir", type=str, default="cnf_cache", help="Binary cache of parsed inputs, empty to disable")
+    parser.add_argument("--portfolio-members", type=str, default="cdcl_wl:mvsids,cdcl_wl:jw,cdcl_wl:mams,cdcl:cvsids,dpll:jw",
+                        help="Comma separated solver:heuristic configurations raced by --solver-name portfolio")
+    parser.add_argument("--share-clauses", type="bool", default=False, help="Share short learnt clauses between cdcl portfolio members")
+    parser.add_argument("--share-max-size", type=int, default=8, help="Longest learnt clause shared")
+    parser.add_argument("--share-max-lbd", type=int, default=4, help="Highest lbd of the learnt clauses shared")
+    parser.add_argument("--share-import-limit", type=int, default=100, help="Clauses imported per return to level 0")
+    parser.add_argument("--cube-depth", type=int, default=8, help="Branching decisions per cube of --solver-name cube_and_conquer")
+    parser.add_argument("--cube-heuristic", type=str, default="up", help="Heuristic splitting the formula into cubes")
+    parser.add_argument("--cube-workers", type=int, default=0, help="Processes solving cubes, 0 for one per core")
+    parser.add_argument("--jobs", type=int, default=1, help="Instances solved in parallel worker processes")
+    parser.add_argument("--timeout", type=float, default=0, help="Seconds per instance before its worker is killed, 0 for none")
+    parser.add_argument("--memory-limit", type=int, default=0, help="Address space limit of each worker in MB, 0 for none")
+    parser.add_argument("--stats-output", type=str, default=None, help="File the statistics of each instance are appended to")
+    parser.add_argument("--stats-format", type=str, default="json", help="Statistics file format: json (one object per line)|csv")
+    parser.add_argument("--profile", type=str, default="none", help="Profile each instance: none|cprofile|sampling")
+    parser.add_argument("--profile-dir", type=str, default="profile/", help="Per-instance profiles, merged collapsed stacks and report")
+    parser.add_argument("--profile-interval", type=float, default=0.001, help="Seconds of CPU time between samples of --profile sampling")
+    parser.add_argument("--reduce-interval", type=int, default=2000, help="Conflicts before the first learnt clause reduction, 0 disables it")
 
 def choose_solver(solver_name):
     if solver_name == "cdcl":
@@ -38,49 +81,302 @@ def choose_solver(solver_name):
         return CryptoSat
     raise ValueError("Unrecognised solver name")
 
+def get_cdcl_kwargs(configs):
+    return dict(restart_policy=configs.restart_policy, restart_interval=configs.restart_interval,
+                reuse_trail=configs.reuse_trail, reduce_interval=configs.reduce_interval,
+                phase_saving=configs.phase_saving, rephase=configs.rephase, lookahead_budget=configs.lookahead_budget,
+                inprocessing=configs.inprocess, inprocess_interval=configs.inprocess_interval,
+                inprocess_budget=configs.inprocess_budget, inprocess_probe_budget=configs.inprocess_probe_budget)
+
+def build_solver(solver_class, configs, cnf, log_file, model_path, clause_sharing=None):
+    solver_args = (cnf.formula, [x+1 for x in range(cnf.num_props)], configs.log_level, log_file, configs.branching_heuristic, model_path)
+    if issubclass(solver_class, CDCL):
+        return solver_class(*solver_args, clause_sharing=clause_sharing, **get_cdcl_kwargs(configs))
+    if issubclass(solver_class, DPLL):
+        return solver_class(*solver_args, lookahead_budget=configs.lookahead_budget)
+    return solver_class(*solver_args)
+
+def get_portfolio_members(configs):
+    members = []
+    for member in configs.portfolio_members.split(","):
+        solver_name, _, heuristic = member.strip().partition(":")
+        member_configs = argparse.Namespace(**vars(configs))
+        member_configs.solver_name = solver_name
+        member_configs.branching_heuristic = heuristic if heuristic else configs.branching_heuristic
+        members.append(("{}:{}".format(solver_name, member_configs.branching_heuristic), member_configs))
+    return members
+
+def solve_portfolio_member(member_configs, cnf, log_file, model_path, result_conn, clause_exchange=None, member_id=0):
+    clause_sharing = None
+    if clause_exchange is not None:
+        clause_sharing = ClauseSharing(clause_exchange, member_id, member_configs.share_max_lbd, member_configs.share_import_limit)
+    solver = build_solver(choose_solver(member_configs.solver_name), member_configs, cnf, log_file, model_path, clause_sharing)
+    result_conn.send(solver.solve())
+    result_conn.close()
+
+def run_portfolio(configs, cnf, log_file, model_path):
+    # Races the members in one process each on the same instance. The first member with
+    # an answer wins and the others are killed right away. With --share-clauses, the cdcl
+    # members exchange their short learnt clauses.
+    formula = cnf.formula
+    members = get_portfolio_members(configs)
+    clause_exchange = ClauseExchange(max_size=configs.share_max_size) if configs.share_clauses else None
+    member_results = [None] * len(members)
+    start_time = time.perf_counter()
+    running = {}
+    for i, (member_name, member_configs) in enumerate(members):
+        member_log_file = "{}.{}".format(log_file, member_name.replace(":", "-")) if log_file else None
+        result_conn, worker_conn = multiprocessing.Pipe(duplex=False)
+        worker = multiprocessing.Process(target=solve_portfolio_member,
+                                         args=(member_configs, cnf, member_log_file, model_path, worker_conn, clause_exchange, i))
+        worker.start()
+        worker_conn.close()
+        running[result_conn] = (worker, i)
+    winner, metric = None, None
+    while running and winner is None:
+        for result_conn in multiprocessing.connection.wait(list(running)):
+            worker, i = running.pop(result_conn)
+            try:
+                member_metric = result_conn.recv()
+                status = "SAT" if member_metric.sat else "UNSAT"
+            except EOFError:
+                member_metric, status = None, "ERROR"
+            result_conn.close()
+            worker.join()
+            member_results[i] = (status, time.perf_counter() - start_time)
+            if member_metric is not None and winner is None:
+                winner, metric = i, member_metric
+    for result_conn, (worker, i) in running.items():
+        worker.kill()
+        worker.join()
+        result_conn.close()
+        member_results[i] = ("CANCELLED", time.perf_counter() - start_time)
+    if winner is None:
+        raise Exception("No portfolio member solved the instance")
+    print("Portfolio winner: {} ({} variables, {} clauses)".format(members[winner][0], cnf.num_props, len(formula)))
+    for (member_name, _), (status, member_time) in zip(members, member_results):
+        print("  {:<20} {:<10} {:.3f}s".format(member_name, status, member_time))
+    if clause_exchange is not None:
+        print("Winner's clause sharing: {} exported, {} imported, {} used in conflict analysis ({} shared in total)".format(
+            metric.num_exported_clauses, metric.num_imported_clauses, metric.num_useful_imports, clause_exchange.head.value))
+    return metric
+
+def use_worker_processes(configs):
+    return configs.jobs > 1 or configs.timeout > 0 or configs.memory_limit > 0
+
 def run_sat_solver(configs):
     if os.path.isdir(configs.input):
         run_sat_solver_multiple(configs)
+        return
+    if use_worker_processes(configs):
+        run_sat_solver_pool(configs, [configs.input])
     else:
-        run_sat_solver_single(configs, configs.input)
+        write_stats(configs, configs.input, run_profiled(configs, configs.input))
+    write_profile_report(configs, [configs.input])
+
+def run_profiled(configs, input_path):
+    # run_sat_solver_single, under the --profile profiler if any. Portfolio members and cube
+    # workers run in their own processes and are not profiled.
+    if configs.profile == "none":
+        return run_sat_solver_single(configs, input_path)
+    # A profile left by an earlier run is removed first, so an instance that times out or fails
+    # has no profile to be merged into this run's report
+    profile_path = get_profile_path(configs, input_path)
+    if os.path.exists(profile_path):
+        os.remove(profile_path)
+    profiler = SolverProfiler(configs.profile, configs.profile_interval)
+    profiler.start()
+    try:
+        metric = run_sat_solver_single(configs, input_path)
+    finally:
+        profiler.stop()
+    os.makedirs(configs.profile_dir, exist_ok=True)
+    profiler.save(profile_path)
+    return metric
+
+def get_profile_path(configs, input_path):
+    return format_output_path(configs.profile_dir, extract_input_name(input_path), PROFILE_EXTENSIONS[configs.profile])
+
+def write_profile_report(configs, input_paths):
+    # Merges the profiles of the instances of this run into profile.collapsed and profile.txt
+    if configs.profile == "none":
+        return
+    stack_counts, report = aggregate_profiles([get_profile_path(configs, input_path) for input_path in input_paths],
+                                              configs.profile, configs.profile_interval)
+    if report is None:
+        return
+    write_collapsed(os.path.join(configs.profile_dir, "profile.collapsed"), stack_counts)
+    SatWriter().write_output(os.path.join(configs.profile_dir, "profile.txt"), report + "\n")
+    print(report)
 
 def run_sat_solver_single(configs, input_path):
-    sat_reader = SatReader()
+    sat_reader = SatReader(configs.cnf_cache_dir)
     sat_writer = SatWriter()
+    start_time = time.perf_counter()
     cnf = sat_reader.read_input(input_path)
-    solver_class = choose_solver(configs.solver_name)
+    parse_time = time.perf_counter() - start_time
+    preprocessor = None
+    if configs.preprocess:
+        input_formula = cnf.formula
+        preprocessor = Preprocessor(input_formula, cnf.num_props, probing=configs.probing)
+        formula = preprocessor.preprocess()
+        print(preprocessor.report())
+        cnf = CNF(cnf.num_props, len(formula), formula=formula)
     input_name = extract_input_name(input_path)
     output_file = format_output_path(configs.output, input_name, ".out")
     log_file = format_output_path(configs.output, input_name, ".log") if configs.log_level else None
     model_path = str(os.path.join(configs.model_dir, configs.model_name)) + ".p" if configs.model_name else None
-    solver = solver_class(cnf.formula, [x+1 for x in range(cnf.num_props)], configs.log_level, log_file, configs.branching_heuristic, model_path)
-    metric = solver.solve()
+    model = None
+    init_time = 0.0
+    if configs.solver_name == "portfolio":
+        metric = run_portfolio(configs, cnf, log_file, model_path)
+    elif configs.solver_name == "cube_and_conquer":
+        solver = CubeAndConquer(cnf.formula, [x+1 for x in range(cnf.num_props)], configs.branching_heuristic,
+                                configs.cube_workers, configs.cube_depth, configs.cube_heuristic, **get_cdcl_kwargs(configs))
+        metric = solver.solve()
+        print(solver.report())
+        model = solver.assignments
+    else:
+        start_time = time.perf_counter()
+        solver = build_solver(choose_solver(configs.solver_name), configs, cnf, log_file, model_path)
+        init_time = time.perf_counter() - start_time
+        metric = solver.solve()
+        model = solver.get_model()
+    metric.parse_time = parse_time
+    metric.init_time = init_time
+    if preprocessor is not None and metric.sat and model is not None:
+        check_model(input_formula, preprocessor.extend_model(model))
     sat_output = "SAT" if metric.sat else "UNSAT"
     sat_writer.write_output(output_file, sat_output)
     print(sat_output, metric.pick_branching_num)
     return metric
 
-def run_sat_solver_multiple(configs):
+def check_model(formula, model):
+    for clause in formula:
+        if not any(model.get(abs(lit), -1) == (1 if lit > 0 else 0) for lit in clause):
+            raise Exception("Model does not satisfy clause {}".format(clause))
+
+def solve_instance_worker(configs, input_path, result_conn):
+    if configs.memory_limit > 0:
+        memory_limit = configs.memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    try:
+        result = ("DONE", run_profiled(configs, input_path))
+    except MemoryError:
+        result = ("MEMOUT", None)
+    result_conn.send(result)
+    result_conn.close()
+
+def write_instance_result(configs, input_path, status, run_time):
+    # Streams one line per finished instance to the result file
+    input_name = extract_input_name(input_path)
+    if status not in ("SAT", "UNSAT"):
+        SatWriter().write_output(format_output_path(configs.output, input_name, ".out"), status)
+        print(status, input_name)
+    with open(configs.result, "a") as f:
+        f.write("{}: {} in {:.3f}s\n".format(input_name, status, run_time))
+
+def run_sat_solver_pool(configs, input_paths):
+    # Each instance runs in its own worker process, at most --jobs at a time, so a worker
+    # over --timeout can be killed without affecting the others. Returns the metrics of
+    # the instances that finished.
+    pending = list(reversed(input_paths))
+    running = {}
     solver_metrics = []
-    for input_name in os.listdir(configs.input):
-        input_path = os.path.join(configs.input, input_name)
-        solver_metric = run_sat_solver_single(configs, input_path)
-        solver_metrics.append(solver_metric)
+    while pending or running:
+        while pending and len(running) < max(configs.jobs, 1):
+            input_path = pending.pop()
+            result_conn, worker_conn = multiprocessing.Pipe(duplex=False)
+            worker = multiprocessing.Process(target=solve_instance_worker, args=(configs, input_path, worker_conn))
+            worker.start()
+            worker_conn.close()
+            running[result_conn] = (worker, input_path, time.perf_counter())
+        wait_time = None
+        if configs.timeout > 0:
+            first_deadline = min(start_time for _, _, start_time in running.values()) + configs.timeout
+            wait_time = max(first_deadline - time.perf_counter(), 0.0)
+        for result_conn in multiprocessing.connection.wait(list(running), wait_time):
+            worker, input_path, start_time = running.pop(result_conn)
+            try:
+                status, metric = result_conn.recv()
+            except EOFError:
+                # The worker died without a result, e.g. killed by the OS
+                status, metric = "ERROR", None
+            result_conn.close()
+            worker.join()
+            if metric is not None:
+                solver_metrics.append(metric)
+                status = "SAT" if metric.sat else "UNSAT"
+                write_stats(configs, input_path, metric)
+            write_instance_result(configs, input_path, status, time.perf_counter() - start_time)
+        if configs.timeout > 0:
+            for result_conn, (worker, input_path, start_time) in list(running.items()):
+                if time.perf_counter() - start_time >= configs.timeout:
+                    worker.kill()
+                    worker.join()
+                    result_conn.close()
+                    del running[result_conn]
+                    write_instance_result(configs, input_path, "TIMEOUT", time.perf_counter() - start_time)
+    return solver_metrics
+
+def run_sat_solver_multiple(configs):
+    input_paths = [os.path.join(configs.input, input_name) for input_name in os.listdir(configs.input)]
+    if use_worker_processes(configs):
+        solver_metrics = run_sat_solver_pool(configs, sorted(input_paths))
+    else:
+        solver_metrics = []
+        for input_path in input_paths:
+            metric = run_profiled(configs, input_path)
+            write_stats(configs, input_path, metric)
+            solver_metrics.append(metric)
     sat_results = [m for m in solver_metrics if m.sat]
     unsat_results = [m for m in solver_metrics if not m.sat]
     print(len(sat_results), len(unsat_results))
     write_metrics_to_output(configs, sat_results, "sat")
     write_metrics_to_output(configs, unsat_results, "unsat")
+    write_profile_report(configs, input_paths)
+
+def write_stats(configs, input_path, metric):
+    # Appends the statistics of one instance to --stats-output, only called from the parent process
+    if not configs.stats_output:
+        return
+    record = dict(instance=extract_input_name(input_path), solver=configs.solver_name,
+                  branching_heuristic=configs.branching_heuristic)
+    record.update(metric.to_record())
+    if configs.stats_format == "json":
+        with open(configs.stats_output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    elif configs.stats_format == "csv":
+        write_header = not os.path.exists(configs.stats_output) or os.path.getsize(configs.stats_output) == 0
+        with open(configs.stats_output, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(record))
+            if write_header:
+                writer.writeheader()
+            writer.writerow(record)
+    else:
+        raise ValueError("Unknown statistics format: {}".format(configs.stats_format))
 
 def write_metrics_to_output(configs, solver_metrics, type):
     if len(solver_metrics) == 0:
         return
     seconds = [metric.exec_time for metric in solver_metrics]
     avg_seconds = sum(seconds) / float(len(seconds))
-    check_clause_status_time = [metric.check_clause_status_time for metric in solver_metrics]
-    avg_check_clause_status_time = sum(check_clause_status_time) / float(len(check_clause_status_time))
+    phase_times = [[metric.parse_time, metric.init_time, metric.propagate_time, metric.analyze_time, metric.decide_time,
+                    metric.inference_time] for metric in solver_metrics]
+    avg_phase_times = [sum(times) / float(len(times)) for times in zip(*phase_times)]
+    avg_propagations_per_sec = sum(metric.propagations_per_sec() for metric in solver_metrics) / float(len(solver_metrics))
+    avg_conflicts_per_sec = sum(metric.conflicts_per_sec() for metric in solver_metrics) / float(len(solver_metrics))
     pick_branching_nums = [metric.pick_branching_num for metric in solver_metrics]
     avg_pick_branching_nums = sum(pick_branching_nums) / float(len(pick_branching_nums))
+    num_restarts = [metric.num_restarts for metric in solver_metrics]
+    avg_num_restarts = sum(num_restarts) / float(len(num_restarts))
+    restart_intervals = [interval for metric in solver_metrics for interval in metric.restart_intervals]
+    avg_restart_interval = sum(restart_intervals) / float(len(restart_intervals)) if restart_intervals else 0.0
+    max_learnt_clauses = [metric.max_learnt_clauses for metric in solver_metrics]
+    avg_max_learnt_clauses = sum(max_learnt_clauses) / float(len(max_learnt_clauses))
+    num_deleted_clauses = [metric.num_deleted_clauses for metric in solver_metrics]
+    avg_num_deleted_clauses = sum(num_deleted_clauses) / float(len(num_deleted_clauses))
+    peak_memory = max(metric.peak_memory for metric in solver_metrics)
     heuristic = configs.branching_heuristic if configs.branching_heuristic else ""
     model_name = configs.model_name if configs.model_name else "" 
     experiment_name = configs.experiment_name if configs.experiment_name else (configs.solver_name + "-" + heuristic + "-" + model_name)
@@ -88,7 +384,15 @@ def write_metrics_to_output(configs, solver_metrics, type):
         f.write("-" * 10 + experiment_name + "-" * 10 + "\n")
         f.write("Average time for {}: {}\n".format(type, str(datetime.timedelta(seconds=avg_seconds))))
         f.write("Average number of picking branching variables for {}: {}\n".format(type, str(avg_pick_branching_nums)))
-        f.write("Average time to check clause status for {}: {}\n".format(type, avg_check_clause_status_time))
+        f.write("Average phase times (s) parse/init/propagate/analyze/decide/inference for {}: {}\n".format(
+            type, "/".join("{:.4f}".format(phase_time) for phase_time in avg_phase_times)))
+        f.write("Average propagations/s and conflicts/s for {}: {:.1f} {:.1f}\n".format(
+            type, avg_propagations_per_sec, avg_conflicts_per_sec))
+        f.write("Average number of restarts for {}: {}\n".format(type, avg_num_restarts))
+        f.write("Average conflicts between restarts for {}: {}\n".format(type, avg_restart_interval))
+        f.write("Average peak number of learnt clauses for {}: {}\n".format(type, avg_max_learnt_clauses))
+        f.write("Average number of deleted learnt clauses for {}: {}\n".format(type, avg_num_deleted_clauses))
+        f.write("Peak memory (KB) for {}: {}\n".format(type, peak_memory))
 
 def extract_input_name(input_path):
     return os.path.basename(input_path)
@@ -0,0 +1,98 @@
+from collections.abc import Mapping
+
+UNASSIGNED = -1
+NO_REASON = -1
+
+class Trail(object):
+    """Assignment trail of a CDCL search.
+
+    values is indexed by literal: values[lit] is 1 if lit is true, 0 if false and -1 if
+    unassigned. Negative literals use Python's negative indexing, so values has 2n+1 slots
+    and values[-var] lands in the upper half. levels and reasons are indexed by variable,
+    reasons holding the id of the clause that implied the variable or NO_REASON.
+    level_limits[i] is the trail position where decision level i+1 starts.
+    """
+    def __init__(self, num_vars=0):
+        self.num_vars = 0
+        self.values = [UNASSIGNED]
+        self.levels = [0]
+        self.reasons = [NO_REASON]
+        self.lits = []
+        self.level_limits = []
+        self.propagated = 0
+        self.grow(num_vars)
+    def grow(self, num_vars):
+        if num_vars <= self.num_vars:
+            return
+        num_new_vars = num_vars - self.num_vars
+        pos_values = self.values[1:self.num_vars+1]
+        neg_values = self.values[self.num_vars+1:]
+        self.values = [UNASSIGNED] + pos_values + [UNASSIGNED] * (2 * num_new_vars) + neg_values
+        self.levels.extend([0] * num_new_vars)
+        self.reasons.extend([NO_REASON] * num_new_vars)
+        self.num_vars = num_vars
+    def decision_level(self):
+        return len(self.level_limits)
+    def new_level(self):
+        self.level_limits.append(len(self.lits))
+    def assign(self, lit, reason=NO_REASON):
+        var = abs(lit)
+        self.values[lit] = 1
+        self.values[-lit] = 0
+        self.levels[var] = len(self.level_limits)
+        self.reasons[var] = reason
+        self.lits.append(lit)
+    def cancel_until(self, level):
+        if len(self.level_limits) <= level:
+            return []
+        limit = self.level_limits[level]
+        values = self.values
+        undone_lits = self.lits[limit:]
+        for lit in undone_lits:
+            values[lit] = UNASSIGNED
+            values[-lit] = UNASSIGNED
+        del self.lits[limit:]
+        del self.level_limits[level:]
+        if self.propagated > limit:
+            self.propagated = limit
+        return undone_lits
+    def clear(self):
+        # Unlike cancel_until(0), also undoes the level 0 assignments
+        undone_lits = self.cancel_until(0)
+        values = self.values
+        for lit in self.lits:
+            values[lit] = UNASSIGNED
+            values[-lit] = UNASSIGNED
+        undone_lits = self.lits + undone_lits
+        self.lits = []
+        self.propagated = 0
+        return undone_lits
+    def decision_lit(self, level):
+        return self.lits[self.level_limits[level-1]]
+    def level_size(self, level):
+        start = 0 if level == 0 else self.level_limits[level-1]
+        end = self.level_limits[level] if level < len(self.level_limits) else len(self.lits)
+        return end - start
+    def level_lits(self, level):
+        start = 0 if level == 0 else self.level_limits[level-1]
+        end = self.level_limits[level] if level < len(self.level_limits) else len(self.lits)
+        return self.lits[start:end]
+    def __len__(self):
+        return len(self.lits)
+
+class AssignmentView(Mapping):
+    """Read-only {var: (value, level)} view of a trail, as the solvers' assignments dicts."""
+    def __init__(self, trail):
+        self.trail = trail
+    def __getitem__(self, var):
+        value = self.trail.values[var] if 0 < var <= self.trail.num_vars else UNASSIGNED
+        if value == UNASSIGNED:
+            raise KeyError(var)
+        return value, self.trail.levels[var]
+    def __contains__(self, var):
+        return 0 < var <= self.trail.num_vars and self.trail.values[var] != UNASSIGNED
+    def __iter__(self):
+        for lit in self.trail.lits:
+            yield abs(lit)
+    def __len__(self):
+        return len(self.trail.lits)
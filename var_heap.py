@@ -0,0 +1,79 @@
+class VarHeap(object):
+    """Indexed binary max-heap of variables ordered by activity.
+
+    activities is shared with the owner and indexed by variable, indices[var] is the
+    position of var in heap or -1 when var is not in the heap.
+    """
+    def __init__(self, activities, vars=()):
+        self.activities = activities
+        self.heap = []
+        self.indices = [-1] * len(activities)
+        self.build(vars)
+    def build(self, vars):
+        for var in self.heap:
+            self.indices[var] = -1
+        self.heap = list(vars)
+        for i, var in enumerate(self.heap):
+            self.indices[var] = i
+        for i in range(len(self.heap) // 2 - 1, -1, -1):
+            self.percolate_down(i)
+    def grow(self, num_vars):
+        if num_vars >= len(self.indices):
+            self.indices.extend([-1] * (num_vars + 1 - len(self.indices)))
+    def __contains__(self, var):
+        return var < len(self.indices) and self.indices[var] >= 0
+    def __len__(self):
+        return len(self.heap)
+    def insert(self, var):
+        if self.indices[var] >= 0:
+            return
+        self.indices[var] = len(self.heap)
+        self.heap.append(var)
+        self.percolate_up(len(self.heap) - 1)
+    def increase(self, var):
+        if self.indices[var] >= 0:
+            self.percolate_up(self.indices[var])
+    def decrease(self, var):
+        if self.indices[var] >= 0:
+            self.percolate_down(self.indices[var])
+    def pop_max(self):
+        heap, indices = self.heap, self.indices
+        top = heap[0]
+        last = heap.pop()
+        indices[top] = -1
+        if heap:
+            heap[0] = last
+            indices[last] = 0
+            self.percolate_down(0)
+        return top
+    def percolate_up(self, i):
+        heap, indices, activities = self.heap, self.indices, self.activities
+        var = heap[i]
+        activity = activities[var]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if activities[heap[parent]] >= activity:
+                break
+            heap[i] = heap[parent]
+            indices[heap[i]] = i
+            i = parent
+        heap[i] = var
+        indices[var] = i
+    def percolate_down(self, i):
+        heap, indices, activities = self.heap, self.indices, self.activities
+        size = len(heap)
+        var = heap[i]
+        activity = activities[var]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and activities[heap[child+1]] > activities[heap[child]]:
+                child += 1
+            if activities[heap[child]] <= activity:
+                break
+            heap[i] = heap[child]
+            indices[heap[i]] = i
+            i = child
+        heap[i] = var
+        indices[var] = i